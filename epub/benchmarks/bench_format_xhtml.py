@@ -0,0 +1,61 @@
+"""
+format_xhtml_content 线性复杂度回归基准
+生成 1–10 MB 的合成章节（大量 <br/> 与空 <p/>），走完整的解析/修改/序列化流程，
+测量耗时并检查每 MB 耗时不随输入增大而上升
+用法: python benchmarks/bench_format_xhtml.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from format_xhtml import format_xhtml_content
+
+SIZES_MB = (1, 2, 5, 10)
+
+# 每 MB 耗时允许的最大增长倍数，超过即视为退化为非线性
+MAX_SCALING_RATIO = 3.0
+
+CHAPTER_LINES = (
+    '<p>正文段落，包含<br/>行内换行。</p>\n',
+    '<br/>\n',
+    '    <p/>\n',
+    '<p class="indent">第二段<span/>文字</p>\n',
+    '  <div class="sep"/>\n',
+)
+
+DOCUMENT_HEAD = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+    '<head>\n<title>第1章 基准</title>\n</head>\n'
+    '<body>\n<h2><span>第1章 基准</span></h2>\n'
+)
+DOCUMENT_TAIL = '</body>\n</html>\n'
+
+def make_content(size_mb):
+    target = size_mb * 1024 * 1024
+    block = ''.join(CHAPTER_LINES)
+    repeat = target // len(block.encode('utf-8')) + 1
+    return DOCUMENT_HEAD + block * repeat + DOCUMENT_TAIL
+
+def main():
+    results = []
+    for size_mb in SIZES_MB:
+        content = make_content(size_mb)
+        start_time = time.perf_counter()
+        format_xhtml_content(content, f'bench_{size_mb}mb.xhtml')
+        elapsed = time.perf_counter() - start_time
+        per_mb = elapsed / size_mb
+        results.append(per_mb)
+        print(f"📊 {size_mb:>2} MB: {elapsed:.3f} 秒，{per_mb * 1000:.1f} 毫秒/MB")
+
+    ratio = results[-1] / results[0]
+    print(f"📊 {SIZES_MB[-1]} MB 与 {SIZES_MB[0]} MB 的每 MB 耗时比: {ratio:.2f}")
+    if ratio > MAX_SCALING_RATIO:
+        print("❌ 耗时增长超过线性")
+        sys.exit(1)
+    print("✅ 线性扩展")
+
+if __name__ == '__main__':
+    main()
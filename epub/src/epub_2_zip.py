@@ -1,11 +1,30 @@
 import os
 import re
+import sys
+import glob
+import json
 import shutil
+import time
 import zipfile
-from lxml import etree
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from tempfile import TemporaryDirectory
+from epub_package import EpubPackage, resolve_member
+from zip_stream import COPY_BUFFER_SIZE, can_copy_raw, copy_member_raw
 
-def epub_to_cbz(epub_path, output_path):
+# 本身已经压缩过的图片格式，重新 deflate 几乎没有收益，直接存储
+PRECOMPRESSED_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+
+def epub_to_cbz(epub_path, output_path, recompress=False):
+    """EPUB 转 CBZ
+
+    已压缩的图片格式总是用 ZIP_STORED 写入：源成员本身是 STORED 时原样复制，
+    被 deflate 过时解压后存储（多花一次解压，但阅读器打开 CBZ 时不必再解压）；
+    其他成员尽量原样复制压缩数据
+    recompress 为 True 时沿用旧的做法：全部解压后重新 deflate
+    返回写入的页数
+    """
     # 支持的图片类型
     image_types = {
         'image/jpeg': '.jpg',
@@ -15,72 +34,66 @@ def epub_to_cbz(epub_path, output_path):
     }
     html_type = 'application/xhtml+xml'
 
-    with TemporaryDirectory() as tempdir:
-        # 解压 EPUB 文件
-        with zipfile.ZipFile(epub_path, 'r') as epub_zip:
-            epub_zip.extractall(tempdir)
-
-        # 自动定位解压后的根目录
-        epub_root = None
-        for root, dirs, files in os.walk(tempdir):
-            if 'META-INF' in dirs and os.path.exists(os.path.join(root, 'META-INF', 'container.xml')):
-                epub_root = root
-                break
-        if epub_root is None:
-            raise Exception('未找到 EPUB 根目录')
-
-        # 解析 container.xml
-        with open(os.path.join(epub_root, 'META-INF', 'container.xml'), 'r', encoding='utf-8') as f:
-            container = etree.parse(f)
-            rootfile = container.xpath('//ns:rootfile', namespaces={'ns': 'urn:oasis:names:tc:opendocument:xmlns:container'})[0]
-            content_opf = os.path.join(epub_root, rootfile.attrib['full-path'])
-
-        # 解析 content.opf
-        opf = etree.parse(content_opf)
-        ns = {'opf': 'http://www.idpf.org/2007/opf'}
+    # 直接从 EPUB 压缩包中读取，不解压到磁盘
+    with zipfile.ZipFile(epub_path, 'r') as epub_zip:
+        # content.opf 只解析一次，封面、spine 和图片路径都走同一份索引
+        package = EpubPackage.from_zip(epub_zip)
+        epub_root = package.root
 
         # 获取封面信息
-        cover_id = opf.xpath('//opf:meta[@name="cover"]/@content', namespaces=ns)
-        cover_href = None
-        if cover_id:
-            cover_item = opf.xpath(f'//opf:item[@id="{cover_id[0]}"]', namespaces=ns)
-            if cover_item:
-                cover_href = cover_item[0].attrib['href']
-
-        # 按 spine 顺序收集图片
+        cover_item = package.cover
+        cover_href = cover_item.href if cover_item else None
+
+        # 按 spine 顺序收集图片（压缩包内路径）
         sorted_images = []
-        for spine_pos, itemref in enumerate(opf.xpath('//opf:spine/opf:itemref', namespaces=ns)):
-            item_id = itemref.attrib['idref']
-            items = opf.xpath(f'//opf:item[@id="{item_id}"]', namespaces=ns)
-            if not items:
+        for item in package.spine:
+            if item.media_type != html_type:
+                continue
+            item_path = resolve_member(epub_zip, item.path, posixpath.join(epub_root, item.href))
+            if not item_path:
                 continue
-            item = items[0]
-            item_href = item.attrib['href']
-            item_media_type = item.attrib['media-type']
-            item_path = os.path.join(epub_root, item_href)
-
-            if item_media_type == html_type:
-                with open(item_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    html_content = f.read()
-                img_pattern = r'<img\s+[^>]*src=["\']([^"\']+)["\']'
-                img_srcs = re.findall(img_pattern, html_content, re.DOTALL)
-                for img_src in img_srcs:
-                    img_name = os.path.basename(img_src)
-                    img_full_path = os.path.join(epub_root, os.path.dirname(item_href), img_src) \
-                        if not os.path.exists(os.path.join(epub_root, img_src)) \
-                        else os.path.join(epub_root, img_src)
+
+            html_content = epub_zip.read(item_path).decode('utf-8', errors='ignore')
+            img_pattern = r'<img\s+[^>]*src=["\']([^"\']+)["\']'
+            img_srcs = re.findall(img_pattern, html_content, re.DOTALL)
+            for img_src in img_srcs:
+                candidates = [posixpath.join(epub_root, img_src),
+                              posixpath.join(posixpath.dirname(item_path), img_src)]
+                # 优先使用 manifest 索引中登记的路径
+                img_item = package.item_for_href(img_src, item_path)
+                if img_item:
+                    candidates.insert(0, img_item.path)
+                img_full_path = resolve_member(epub_zip, *candidates)
+                if img_full_path:
                     sorted_images.append(img_full_path)
 
-        # 保存图片到临时目录
-        with TemporaryDirectory() as output_temp:
+        # 图片直接从 EPUB 流式写入 CBZ
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as cbz, \
+                open(epub_path, 'rb') as raw_src:
             written = set()
             count = 0
+
+            def copy_member(member, arcname):
+                info = epub_zip.getinfo(member)
+                precompressed = arcname.lower().endswith(PRECOMPRESSED_EXTS)
+                # 已压缩的图片只有源成员本身是 STORED 时才原样复制，否则解压后存储
+                if (not recompress and can_copy_raw(info)
+                        and not (precompressed and info.compress_type != zipfile.ZIP_STORED)):
+                    copy_member_raw(raw_src, info, cbz, arcname)
+                    return
+
+                zinfo = zipfile.ZipInfo(arcname, date_time=info.date_time)
+                if recompress or not precompressed:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with epub_zip.open(member) as src, cbz.open(zinfo, 'w') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
             # 处理封面
             if cover_href:
-                cover_path = os.path.join(epub_root, cover_href)
+                cover_path = resolve_member(epub_zip, cover_item.path, posixpath.join(epub_root, cover_href))
                 cover_ext = os.path.splitext(cover_href)[1]
-                if os.path.exists(cover_path):
-                    shutil.copyfile(cover_path, os.path.join(output_temp, f'{count:05d}{cover_ext}'))
+                if cover_path:
+                    copy_member(cover_path, f'{count:05d}{cover_ext}')
                     written.add(cover_path)
                     count += 1
             else:
@@ -88,28 +101,128 @@ def epub_to_cbz(epub_path, output_path):
 
             # 按顺序保存页面图片
             for img_path in sorted_images:
-                if img_path not in written and os.path.exists(img_path):
+                if img_path not in written:
                     ext = cover_ext if cover_ext else os.path.splitext(img_path)[1]
-                    shutil.copyfile(img_path, os.path.join(output_temp, f'{count:05d}{ext}'))
+                    copy_member(img_path, f'{count:05d}{ext}')
                     written.add(img_path)
                     count += 1
 
-            # 打包为 CBZ
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as cbz:
-                for file in sorted(os.listdir(output_temp)):
-                    cbz.write(os.path.join(output_temp, file), arcname=file)
-
-    print(f'转换完成 : {output_path}')
+    return count
 
 import argparse
 
+def collect_epubs(paths):
+    """把命令行参数（文件、文件夹或通配符）展开为 EPUB 文件列表"""
+    epub_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            epub_paths.extend(sorted(os.path.join(path, f) for f in os.listdir(path)
+                                     if f.lower().endswith('.epub')))
+        elif os.path.isfile(path):
+            epub_paths.append(path)
+        else:
+            epub_paths.extend(sorted(p for p in glob.glob(path, recursive=True)
+                                     if p.lower().endswith('.epub')))
+    # 去重并保持顺序
+    return list(dict.fromkeys(epub_paths))
+
+def convert_book(epub_path, recompress=False, force=False):
+    """转换单本 EPUB，出错不抛异常，返回结果记录"""
+    output_path = os.path.splitext(epub_path)[0] + '.cbz'
+    result = {'epub': epub_path, 'cbz': output_path, 'status': 'converted', 'pages': 0,
+              'bytes_in': os.path.getsize(epub_path), 'bytes_out': 0, 'seconds': 0.0, 'error': None}
+
+    # CBZ 比源文件新，视为已转换
+    if not force and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(epub_path):
+        result['status'] = 'skipped'
+        result['bytes_out'] = os.path.getsize(output_path)
+        return result
+
+    # 先写到临时文件，成功后再替换，避免失败留下的半成品在下次被当成已转换
+    tmp_path = output_path + '.tmp'
+    start_time = time.perf_counter()
+    try:
+        result['pages'] = epub_to_cbz(epub_path, tmp_path, recompress=recompress)
+        os.replace(tmp_path, output_path)
+        result['bytes_out'] = os.path.getsize(output_path)
+        print(f'转换完成 : {output_path}')
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+        print(f'❌ 转换失败: {epub_path} - {e}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    result['seconds'] = time.perf_counter() - start_time
+    return result
+
+def convert_library(epub_paths, jobs=1, recompress=False, force=False):
+    """批量转换，jobs > 1 时多本书并行，单本失败不影响其他书"""
+    if jobs > 1 and len(epub_paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(convert_book, epub_paths, repeat(recompress), repeat(force)))
+    return [convert_book(epub_path, recompress, force) for epub_path in epub_paths]
+
+def print_summary(results, elapsed):
+    converted = [r for r in results if r['status'] == 'converted']
+    skipped = [r for r in results if r['status'] == 'skipped']
+    failed = [r for r in results if r['status'] == 'failed']
+    bytes_in = sum(r['bytes_in'] for r in converted)
+    bytes_out = sum(r['bytes_out'] for r in converted)
+
+    print(f'\n📊 共 {len(results)} 本：转换 {len(converted)}，跳过 {len(skipped)}，失败 {len(failed)}')
+    print(f'📊 页数 {sum(r["pages"] for r in converted)}，输入 {bytes_in / 1024 / 1024:.1f} MB，'
+          f'输出 {bytes_out / 1024 / 1024:.1f} MB，耗时 {elapsed:.2f} 秒')
+    for r in failed:
+        print(f'⚠️ 失败: {r["epub"]} - {r["error"]}')
+
+def benchmark(epub_paths):
+    """比较重新 deflate 与原样复制两种写入方式的吞吐量"""
+    total_bytes = sum(os.path.getsize(path) for path in epub_paths)
+    print(f'📊 基准测试: {len(epub_paths)} 本 EPUB，共 {total_bytes / 1024 / 1024:.1f} MB')
+
+    for label, recompress in (('重新 deflate', True), ('原样复制', False)):
+        with TemporaryDirectory() as output_dir:
+            start_time = time.perf_counter()
+            for index, epub_path in enumerate(epub_paths):
+                epub_to_cbz(epub_path, os.path.join(output_dir, f'{index}.cbz'), recompress=recompress)
+            elapsed = time.perf_counter() - start_time
+            output_bytes = sum(entry.stat().st_size for entry in os.scandir(output_dir))
+        throughput = total_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0.0
+        print(f'📊 {label}: 耗时 {elapsed:.2f} 秒，{throughput:.1f} MB/s，输出 {output_bytes / 1024 / 1024:.1f} MB')
+
 def main():
     parser = argparse.ArgumentParser(description='将 EPUB 文件转换为 CBZ 格式')
-    parser.add_argument('epub_path', help='EPUB 文件路径')
+    parser.add_argument('epub_paths', nargs='+', help='EPUB 文件、包含 EPUB 的文件夹或通配符')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行转换的进程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--force', action='store_true', help='即使 CBZ 比 EPUB 新也重新转换')
+    parser.add_argument('--report', help='把汇总报告写入 JSON 文件')
+    parser.add_argument('--recompress', action='store_true', help='重新 deflate 所有图片（旧的写入方式）')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='基准测试：比较重新 deflate 与原样复制的吞吐量')
     args = parser.parse_args()
 
-    output_path = os.path.splitext(args.epub_path)[0] + '.cbz'
-    epub_to_cbz(args.epub_path, output_path)
+    epub_paths = collect_epubs(args.epub_paths)
+    if not epub_paths:
+        print('错误: 未找到 EPUB 文件')
+        sys.exit(1)
+
+    if args.benchmark:
+        benchmark(epub_paths)
+        return
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    start_time = time.perf_counter()
+    results = convert_library(epub_paths, jobs, args.recompress, args.force)
+    elapsed = time.perf_counter() - start_time
+    print_summary(results, elapsed)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'seconds': elapsed, 'books': results}, f, ensure_ascii=False, indent=2)
+
+    if any(r['status'] == 'failed' for r in results):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+EPUB 一步打包工具（替代 format-xhtml → content_opf_generate.sh → toc_ncx_generate.sh → 复制模板 → compress_epub.sh）
+功能：
+1. 读取原始章节文件夹中的 XHTML，在内存中格式化（与 format-xhtml 相同的处理）
+2. 根据格式化后的标题生成 content.opf 和 toc.ncx
+3. 注入 Resources/template 中的 container.xml、style.css 以及 note.png，文件夹中有 cover.jpg 时一并加入
+4. 直接写出 .epub：mimetype 不压缩且作为第一个条目，不产生任何中间目录
+"""
+import os
+import sys
+import uuid
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from epub_package import CONTAINER_PATH, write_epub_mimetype
+from format_xhtml import (format_epub_member, set_skip_title_patterns, load_skip_title_patterns,
+                          active_skip_title_patterns)
+from generate_opf_ncx import chapter_title, list_chapter_files, build_content_opf, build_toc_ncx, print_stats
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Resources')
+
+# 压缩包内的布局，与 Resources/template 一致
+OEBPS_DIR = 'OEBPS'
+TEXT_FOLDER = 'Text'
+NOTE_IMAGE_HREF = 'Images/note.png'
+COVER_NAME = 'cover.jpg'
+
+def format_chapters(source_dir, filenames, indent_size=4, jobs=1):
+    """在内存中格式化所有章节，返回 ([(文件名, 内容字节), ...], 失败列表)；失败的章节保留原文"""
+    raw_contents = []
+    for filename in filenames:
+        with open(os.path.join(source_dir, filename), 'rb') as f:
+            raw_contents.append(f.read())
+
+    if jobs > 1 and len(filenames) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_skip_title_patterns,
+                                 initargs=(active_skip_title_patterns,)) as executor:
+            chunksize = max(1, len(filenames) // (jobs * 4))
+            results = list(executor.map(format_epub_member, raw_contents, filenames,
+                                        repeat(indent_size), chunksize=chunksize))
+    else:
+        results = [format_epub_member(raw, name, indent_size) for raw, name in zip(raw_contents, filenames)]
+
+    chapters = []
+    errors = []
+    for filename, raw, (success, error, content, output) in zip(filenames, raw_contents, results):
+        print(output, end='')
+        if success:
+            chapters.append((filename, content))
+        else:
+            print(f"❌❌ 失败: {filename} - {error}")
+            errors.append(filename)
+            chapters.append((filename, raw))
+    return chapters, errors
+
+def build_epub(source_dir, output_path, resources_dir=RESOURCES_DIR, indent_size=4, jobs=1, book_uuid=None):
+    """把章节文件夹直接打包为 EPUB，返回 (目录统计, 格式化失败的文件列表)"""
+    template_dir = os.path.join(resources_dir, 'template')
+    note_path = os.path.join(resources_dir, 'note.png')
+    cover_path = os.path.join(source_dir, COVER_NAME)
+    has_cover = os.path.isfile(cover_path)
+    book_uuid = book_uuid or str(uuid.uuid4())
+
+    filenames = list_chapter_files(source_dir)
+    if not filenames:
+        raise ValueError(f"在 '{source_dir}' 中未找到任何 xhtml 文件")
+    print(f"📊📊 找到 {len(filenames)} 个章节文件")
+
+    chapters, errors = format_chapters(source_dir, filenames, indent_size, jobs)
+
+    # 目录使用格式化后的标题（格式化可能根据 h2 更新了 <title>）
+    titles = [(filename, chapter_title(content.decode('utf-8', errors='ignore'))) for filename, content in chapters]
+    extra_items = [('note', NOTE_IMAGE_HREF, 'image/png')] if os.path.isfile(note_path) else []
+    opf_content = build_content_opf(filenames, TEXT_FOLDER, book_uuid, has_cover, extra_items)
+    ncx_content, stats = build_toc_ncx(titles, TEXT_FOLDER, book_uuid)
+
+    # 先写临时文件，完成后再替换
+    tmp_path = output_path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        write_epub_mimetype(epub)
+        epub.write(os.path.join(template_dir, CONTAINER_PATH), CONTAINER_PATH)
+        epub.writestr(f'{OEBPS_DIR}/content.opf', opf_content)
+        epub.writestr(f'{OEBPS_DIR}/toc.ncx', ncx_content)
+        epub.write(os.path.join(template_dir, OEBPS_DIR, 'style.css'), f'{OEBPS_DIR}/style.css')
+        # 图片本身已经压缩过，不再 deflate
+        if extra_items:
+            epub.write(note_path, f'{OEBPS_DIR}/{NOTE_IMAGE_HREF}', compress_type=zipfile.ZIP_STORED)
+        if has_cover:
+            epub.write(cover_path, f'{OEBPS_DIR}/{COVER_NAME}', compress_type=zipfile.ZIP_STORED)
+        for filename, content in chapters:
+            epub.writestr(f'{OEBPS_DIR}/{TEXT_FOLDER}/{filename}', content)
+    os.replace(tmp_path, output_path)
+
+    return stats, errors
+
+def main():
+    parser = argparse.ArgumentParser(description='把原始章节文件夹直接打包为 EPUB（格式化 + OPF/NCX + 模板资源）')
+    parser.add_argument('source_dir', help='章节 XHTML 文件夹路径（可包含 cover.jpg）')
+    parser.add_argument('-o', '--output', help='输出 EPUB 路径（默认与文件夹同名，放在其父目录）')
+    parser.add_argument('--indent', type=int, default=4, help='缩进空格数（默认4）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行格式化的进程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--rules', help='追加跳过body格式化标题规则的 JSON 配置文件')
+    parser.add_argument('--resources', default=RESOURCES_DIR, help='资源目录（包含 template 和 note.png）')
+    parser.add_argument('--uuid', help='指定书籍 UUID（默认随机生成）')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source_dir):
+        print(f"错误: 文件夹 '{args.source_dir}' 不存在")
+        sys.exit(1)
+
+    if args.rules:
+        set_skip_title_patterns(load_skip_title_patterns(args.rules))
+
+    source_dir = os.path.abspath(args.source_dir)
+    output_path = args.output or f"{source_dir}.epub"
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    print(f"🔍🔍 读取章节: {source_dir}")
+    try:
+        stats, errors = build_epub(source_dir, output_path, args.resources, args.indent, jobs, args.uuid)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    print(f"✅ EPUB生成成功！路径：{output_path}")
+    print_stats(stats)
+    if errors:
+        print(f"⚠️ 格式化失败（已保留原文）: {', '.join(errors)}")
+
+if __name__ == '__main__':
+    main()
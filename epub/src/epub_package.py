@@ -0,0 +1,101 @@
+"""
+EPUB 包模型：只解析一次 content.opf，建立 id → item、路径 → item 索引
+供 epub 相关工具共用（封面查找、spine 遍历、资源路径解析）
+"""
+import posixpath
+import zipfile
+from dataclasses import dataclass
+from urllib.parse import unquote
+from lxml import etree
+
+CONTAINER_PATH = 'META-INF/container.xml'
+CONTAINER_NS = {'ns': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+OPF_NS = {'opf': 'http://www.idpf.org/2007/opf'}
+
+XHTML_MEDIA_TYPE = 'application/xhtml+xml'
+EPUB_MIMETYPE = 'application/epub+zip'
+
+def normalize_path(path):
+    """把 href 拼接结果规范化为压缩包内的路径"""
+    return posixpath.normpath(unquote(path))
+
+def find_epub_root(epub_zip):
+    """定位 EPUB 根目录（包含 META-INF/container.xml 的目录）在压缩包内的前缀"""
+    for name in epub_zip.namelist():
+        if name == CONTAINER_PATH or name.endswith('/' + CONTAINER_PATH):
+            return name[:-len(CONTAINER_PATH)]
+    raise Exception('未找到 EPUB 根目录')
+
+def write_epub_mimetype(epub_zip):
+    """写入 mimetype：必须是压缩包的第一个条目，且不能压缩"""
+    epub_zip.writestr(zipfile.ZipInfo('mimetype'), EPUB_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+
+def resolve_member(epub_zip, *candidates):
+    """按顺序返回第一个存在于压缩包中的路径"""
+    names = epub_zip.NameToInfo
+    for candidate in candidates:
+        path = normalize_path(candidate)
+        if path in names:
+            return path
+    return None
+
+@dataclass(frozen=True)
+class ManifestItem:
+    """manifest 中的一项，path 为相对 EPUB 根的完整路径"""
+    id: str
+    href: str
+    media_type: str
+    path: str
+    properties: str = ''
+
+class EpubPackage:
+    """content.opf 的索引视图"""
+
+    def __init__(self, opf, opf_path, root=''):
+        self.opf = opf
+        self.opf_path = opf_path
+        self.opf_dir = posixpath.dirname(opf_path)
+        self.root = root
+
+        self.items_by_id = {}
+        self.items_by_path = {}
+        for element in opf.iterfind('opf:manifest/opf:item', OPF_NS):
+            href = element.get('href')
+            item_id = element.get('id')
+            if not href or not item_id:
+                continue
+            item = ManifestItem(
+                id=item_id,
+                href=href,
+                media_type=element.get('media-type', ''),
+                path=normalize_path(posixpath.join(self.opf_dir, href)),
+                properties=element.get('properties', ''),
+            )
+            self.items_by_id[item.id] = item
+            self.items_by_path[item.path] = item
+
+        self.spine = []
+        for itemref in opf.iterfind('opf:spine/opf:itemref', OPF_NS):
+            item = self.items_by_id.get(itemref.get('idref'))
+            if item is not None:
+                self.spine.append(item)
+
+    @classmethod
+    def from_zip(cls, epub_zip):
+        """直接从 EPUB 压缩包中读取 container.xml 和 content.opf"""
+        root = find_epub_root(epub_zip)
+        container = etree.fromstring(epub_zip.read(root + CONTAINER_PATH))
+        rootfile = container.xpath('//ns:rootfile', namespaces=CONTAINER_NS)[0]
+        opf_path = posixpath.join(root, rootfile.attrib['full-path'])
+        return cls(etree.fromstring(epub_zip.read(opf_path)), opf_path, root)
+
+    @property
+    def cover(self):
+        """<meta name="cover"> 指向的封面项"""
+        cover_id = self.opf.xpath('//opf:meta[@name="cover"]/@content', namespaces=OPF_NS)
+        return self.items_by_id.get(cover_id[0]) if cover_id else None
+
+    def item_for_href(self, href, base_path=None):
+        """把相对 base_path（默认 content.opf）的 href 解析为 manifest 项"""
+        base_dir = posixpath.dirname(base_path) if base_path else self.opf_dir
+        return self.items_by_path.get(normalize_path(posixpath.join(base_dir, href.split('#', 1)[0])))
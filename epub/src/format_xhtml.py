@@ -7,15 +7,29 @@ EPUB XHTML文件格式化工具（支持文件名排序处理）
 4. 4空格缩进格式化（特定条件下跳过）
 5. 将h2-span文本复制到title（特定条件下跳过）
 6. 清理head部分
-7. 特定卷/部/番外标题跳过body格式化和标题更新
+7. 特定卷/部/番外标题跳过body格式化和标题更新（可通过 --rules 指定的 JSON 文件追加规则，
+   格式: {"skip_title_patterns": ["^第[一二三四五六七八九十零百千万\\d]+集$"]}）
+8. 按源文件内容哈希缓存，内容和设置都没变的文件直接沿用上次的输出
+9. 直接处理 .epub：XHTML 在内存中格式化，其余资源原样复制，输出 <书名>_formatted.epub
 """
+import io
 import os
+import copy
+import json
+import hashlib
 import argparse
 import re
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext, redirect_stdout
+from itertools import repeat
 from lxml import etree
+from epub_package import EpubPackage, XHTML_MEDIA_TYPE, write_epub_mimetype
+from zip_stream import COPY_BUFFER_SIZE, can_copy_raw, copy_member_raw
 
-# 需要保留换行的自闭合标签列表
-LINE_PRESERVING_TAGS = {"p", "div", "span", "a", "ul", "li", "h1", "h2", "h3", "br"}
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
 
 # 标准头部声明
 STANDARD_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
@@ -31,16 +45,53 @@ SKIP_TITLE_PATTERNS = [
     r'^番外$'                          # 仅"番外"
 ]
 
+# 格式化逻辑的版本，输出格式发生变化时递增，使旧缓存失效
+FORMATTER_VERSION = 2
+
+# 输出目录中的缓存文件
+FORMAT_CACHE_NAME = '.format_cache.json'
+
+TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+HEAD_END_PATTERN = re.compile(r'</head\s*>', re.IGNORECASE)
+
+def compile_skip_title_patterns(patterns):
+    """把所有跳过规则合并成一个预编译的多分支正则"""
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+# 当前生效的跳过规则（默认规则 + 配置文件追加的规则）
+active_skip_title_patterns = list(SKIP_TITLE_PATTERNS)
+skip_title_regex = compile_skip_title_patterns(active_skip_title_patterns)
+
+def set_skip_title_patterns(patterns):
+    """替换当前生效的跳过规则；也用作进程池的 initializer，让子进程使用同一套规则"""
+    global active_skip_title_patterns, skip_title_regex
+    active_skip_title_patterns = list(patterns)
+    skip_title_regex = compile_skip_title_patterns(active_skip_title_patterns)
+
+def load_skip_title_patterns(rules_path):
+    """读取规则配置文件，返回默认规则加上文件中追加的规则"""
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    extra_patterns = config.get('skip_title_patterns', [])
+    for pattern in extra_patterns:
+        # 提前编译，规则写错时在启动阶段报错
+        re.compile(pattern)
+    return SKIP_TITLE_PATTERNS + [pattern for pattern in extra_patterns if pattern not in SKIP_TITLE_PATTERNS]
+
 def should_skip_body_formatting(title_text):
     """检查标题是否符合跳过body格式化的条件"""
     if not title_text:
         return False
-    title_text = title_text.strip()
-    return any(re.match(pattern, title_text) for pattern in SKIP_TITLE_PATTERNS)
+    return skip_title_regex.match(title_text.strip()) is not None
 
 def extract_title_from_raw_content(content):
-    """直接从原始内容中提取<title>标签内容"""
-    title_match = re.search(r'<title[^>]*>(.*?)</title>', content, re.IGNORECASE | re.DOTALL)
+    """直接从原始内容中提取<title>标签内容，只搜索到</head>为止
+
+    供不需要解析整棵树的调用方使用（如 generate_opf_ncx）；format-xhtml 本身用 extract_title_from_tree
+    """
+    head_end = HEAD_END_PATTERN.search(content)
+    end_pos = head_end.start() if head_end else len(content)
+    title_match = TITLE_PATTERN.search(content, 0, end_pos)
     return title_match.group(1).strip() if title_match else None
 
 def extract_declarations(content):
@@ -66,61 +117,66 @@ def extract_declarations(content):
 
     return xml_declaration, doctype, content[body_start:].lstrip()
 
-def format_self_closing_tags(content):
-    """预处理：保留特定自闭合标签的单独换行特性"""
-    pattern = r'<([a-z]+:)?([a-z0-9]+)([^>]*)/>'
-
-    def replace_tag(match):
-        ns_prefix = match.group(1) or ""
-        tag_name = match.group(2)
-        attributes = match.group(3)
-
-        if tag_name in LINE_PRESERVING_TAGS:
-            start_pos = match.start()
-            preceding_text = content[:start_pos]
-            if "\n" in preceding_text:
-                last_newline = preceding_text.rfind("\n")
-                if not preceding_text[last_newline+1:start_pos].strip():
-                    return f"<{ns_prefix}{tag_name}{attributes}></{ns_prefix}{tag_name}>"
-
-        return match.group(0)
-
-    return re.sub(pattern, replace_tag, content, flags=re.IGNORECASE)
-
 def fix_self_closing_tags(root):
     """修复非空元素的自闭合标签"""
     non_void_elements = {"p", "div", "span", "a", "ul", "li", "h1", "h2", "h3"}
 
-    for tag in root.iter():
+    for tag in root.iter(etree.Element):
         tag_name = tag.tag.split("}")[-1] if '}' in tag.tag else tag.tag
         if tag_name in non_void_elements and tag.text is None and len(tag) == 0:
             tag.text = ""
 
-def standardize_html_tag(content):
-    """确保<html>标签包含必要的属性和值"""
-    html_match = re.search(r'<html\b([^>]*)>', content, re.IGNORECASE)
-    if not html_match:
-        return content
-
-    html_attrs = html_match.group(1)
-    attrs_dict = {}
-
-    for attr_match in re.finditer(r'(\w+)\s*=\s*["\']([^"\']*)["\']', html_attrs):
-        attrs_dict[attr_match.group(1).lower()] = attr_match.group(2)
-
-    if "xmlns" not in attrs_dict:
-        attrs_dict["xmlns"] = "http://www.w3.org/1999/xhtml"
-    if "xml:lang" not in attrs_dict:
-        attrs_dict["xml:lang"] = "zh-Hans"
-
-    new_attrs = ' '.join([f'{k}="{v}"' for k, v in attrs_dict.items()])
-    new_html_tag = f'<html {new_attrs}>'
-
-    return content.replace(html_match.group(0), new_html_tag)
+def move_into_namespace(element, namespace):
+    """把没有命名空间的元素（及其子孙）重建到指定的默认命名空间下"""
+    def qualify(tag):
+        return tag if tag.startswith("{") else f"{{{namespace}}}{tag}"
+
+    def copy_children(source, target):
+        target.text = source.text
+        for child in source:
+            if isinstance(child.tag, str):
+                new_child = etree.SubElement(target, qualify(child.tag), attrib=dict(child.attrib))
+                copy_children(child, new_child)
+            else:
+                # 注释、处理指令原样保留
+                new_child = copy.copy(child)
+                target.append(new_child)
+            new_child.tail = child.tail
+
+    new_element = etree.Element(qualify(element.tag), attrib=dict(element.attrib), nsmap={None: namespace})
+    copy_children(element, new_element)
+    new_element.tail = element.tail
+    return new_element
+
+def standardize_html_tag(html_root):
+    """确保<html>元素位于XHTML命名空间并带有xml:lang，返回（可能重建后的）html元素"""
+    if etree.QName(html_root).namespace is None:
+        parent = html_root.getparent()
+        new_root = move_into_namespace(html_root, XHTML_NS)
+        if parent is not None:
+            parent.replace(html_root, new_root)
+        html_root = new_root
+
+    if html_root.get(XML_LANG) is None:
+        html_root.set(XML_LANG, "zh-Hans")
+
+    return html_root
+
+def find_head(html_root, xhtml_ns):
+    """<head> 是 <html> 的直接子元素，只查找直接子元素，不遍历 body"""
+    return html_root.find(f"{{{xhtml_ns}}}head")
+
+def extract_title_from_tree(html_root, xhtml_ns):
+    """从已解析的文档中提取<title>文本，只查看 head 的直接子元素"""
+    head = find_head(html_root, xhtml_ns)
+    title = head.find(f"{{{xhtml_ns}}}title") if head is not None else None
+    if title is None:
+        return None
+    return "".join(title.itertext()).strip()
 
 def clean_head_section(root, xhtml_ns):
     """清理head部分，只保留title和stylesheet链接"""
-    head = root.find(f".//{{{xhtml_ns}}}head")
+    head = find_head(root, xhtml_ns)
     if head is None:
         return
 
@@ -141,7 +197,7 @@ def clean_head_section(root, xhtml_ns):
 
 def update_title_from_h2(root, xhtml_ns):
     """将h2-span文本复制到title标签"""
-    head = root.find(f".//{{{xhtml_ns}}}head")
+    head = find_head(root, xhtml_ns)
     if head is None:
         return
 
@@ -160,6 +216,80 @@ def update_title_from_h2(root, xhtml_ns):
     elif h2.text:
         title.text = h2.text.strip()
 
+def natural_sort_key(filename):
+    """文件名自然排序：数字部分按数值比较，其余部分忽略大小写"""
+    return [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', filename)]
+
+def format_xhtml_content(raw_content, display_name, indent_size=4):
+    """格式化XHTML文本：解析一次，所有修改都作用在同一棵树上，最后序列化一次
+
+    返回格式化后的完整内容，解析失败时抛出异常
+    """
+    # 分离声明与主体内容，强制使用标准声明
+    _, _, body_content = extract_declarations(raw_content)
+    xml_decl = STANDARD_XML_DECLARATION
+    doctype = STANDARD_DOCTYPE
+
+    # 使用不改变空白的解析器
+    parser = etree.XMLParser(
+        remove_blank_text=False,
+        resolve_entities=False,
+        recover=True
+    )
+
+    # 包裹根元素确保解析有效（html 前后可能还有注释等节点）
+    root = etree.fromstring(f"<root>{body_content}</root>".encode('utf-8'), parser)
+
+    # 获取真正的html根元素
+    html_root = next((child for child in root
+                      if isinstance(child.tag, str) and etree.QName(child).localname == "html"), None)
+    if html_root is None:
+        html_root = root[0]
+
+    # 标准化<html>标签属性（缺少命名空间时整棵树移入XHTML命名空间）
+    html_root = standardize_html_tag(html_root)
+    xhtml_ns = XHTML_NS
+
+    # 提取原始标题，决定是否跳过body处理
+    raw_title = extract_title_from_tree(html_root, xhtml_ns)
+    skip_body_processing = should_skip_body_formatting(raw_title) if raw_title else False
+
+    if skip_body_processing:
+        print(f"⏩ 跳过body处理: {display_name} - '{raw_title}'")
+
+    # ==== 清理head部分（所有文件都执行） ====
+    clean_head_section(html_root, xhtml_ns)
+
+    # ==== 条件性更新标题与body处理 ====
+    if not skip_body_processing:
+        update_title_from_h2(html_root, xhtml_ns)
+
+        # 修复自闭合标签（空的非空元素输出为 <p></p>）
+        fix_self_closing_tags(html_root)
+
+        # 应用缩进
+        etree.indent(html_root, space=" " * indent_size)
+
+    # 序列化主体
+    serialized_body = etree.tostring(
+        html_root,
+        encoding="utf-8",
+        xml_declaration=False,
+        pretty_print=not skip_body_processing,
+        method="xml"
+    ).decode('utf-8')
+
+    # 后处理：恢复单独成行的空标签
+    if not skip_body_processing:
+        serialized_body = re.sub(
+            r'<(/?)(p|div|span|a|ul|li|h1|h2|h3|br)([^>]*)>\s*</\2>',
+            r'<\1\2\3></\2>',
+            serialized_body
+        )
+
+    # 组合最终内容
+    return f"{xml_decl}\n{doctype}\n{serialized_body}"
+
 def format_epub_xhtml_file(input_path, output_path, indent_size=4):
     """格式化EPUB XHTML文件（精确控制版）"""
     try:
@@ -167,87 +297,7 @@ def format_epub_xhtml_file(input_path, output_path, indent_size=4):
         with open(input_path, 'r', encoding='utf-8') as f:
             raw_content = f.read()
 
-        # 提取原始标题
-        raw_title = extract_title_from_raw_content(raw_content)
-        skip_body_processing = should_skip_body_formatting(raw_title) if raw_title else False
-
-        if skip_body_processing:
-            print(f"⏩ 跳过body处理: {os.path.basename(input_path)} - '{raw_title}'")
-
-        # 标准化<html>标签属性
-        processed_content = standardize_html_tag(raw_content)
-
-        # 分离声明与主体内容
-        xml_decl, doctype, body_content = extract_declarations(processed_content)
-
-        # 强制使用标准声明
-        xml_decl = STANDARD_XML_DECLARATION
-        doctype = STANDARD_DOCTYPE
-
-        # ==== 关键修改：所有文件都解析文档 ====
-        # 使用不改变空白的解析器
-        parser = etree.XMLParser(
-            remove_blank_text=False,
-            resolve_entities=False,
-            recover=True
-        )
-
-        # 创建包含完整文档的内容
-        full_body = f"<root>{body_content}</root>"  # 包裹根元素确保解析有效
-        root = etree.fromstring(full_body.encode('utf-8'), parser)
-
-        # 获取实际使用的命名空间
-        namespaces = root[0].nsmap if len(root) > 0 else {}
-        xhtml_ns = namespaces.get(None, "http://www.w3.org/1999/xhtml")
-
-        # 获取真正的html根元素
-        html_root = root.find(f".//{{{xhtml_ns}}}html")
-        if html_root is None:
-            html_root = root.find(".//html") or root[0]
-
-        # ==== 清理head部分（所有文件都执行） ====
-        clean_head_section(html_root, xhtml_ns)
-
-        # ==== 条件性更新标题 ====
-        if not skip_body_processing:
-            update_title_from_h2(html_root, xhtml_ns)
-
-        # ==== 条件性body处理 ====
-        if not skip_body_processing:
-            # 处理自闭合标签
-            processed_body = format_self_closing_tags(body_content)
-            root = etree.fromstring(f"<root>{processed_body}</root>".encode('utf-8'), parser)
-            html_root = root.find(f".//{{{xhtml_ns}}}html") or root[0]
-
-            # 修复自闭合标签
-            fix_self_closing_tags(html_root)
-
-            # 应用缩进
-            etree.indent(html_root, space=" " * indent_size)
-
-        # 序列化主体
-        serialized_body = etree.tostring(
-            html_root,
-            encoding="utf-8",
-            xml_declaration=False,
-            pretty_print=not skip_body_processing,
-            method="xml"
-        ).decode('utf-8')
-
-        # 移除包裹的根元素
-        if serialized_body.startswith('<root>'):
-            serialized_body = serialized_body[6:-7]
-
-        # 后处理：恢复单独成行的空标签
-        if not skip_body_processing:
-            serialized_body = re.sub(
-                r'<(/?)(p|div|span|a|ul|li|h1|h2|h3|br)([^>]*)>\s*</\2>',
-                r'<\1\2\3></\2>', 
-                serialized_body
-            )
-
-        # 组合最终内容
-        full_content = f"{xml_decl}\n{doctype}\n{serialized_body}"
+        full_content = format_xhtml_content(raw_content, os.path.basename(input_path), indent_size)
 
         # 写入文件
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -258,12 +308,144 @@ def format_epub_xhtml_file(input_path, output_path, indent_size=4):
     except Exception as e:
         return False, f"解析失败: {str(e)}"
 
+def format_file_captured(input_path, output_path, indent_size=4):
+    """在子进程中格式化文件，并捕获控制台输出，交给主进程按顺序打印"""
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        success, error = format_epub_xhtml_file(input_path, output_path, indent_size)
+    return success, error, buffer.getvalue()
+
+def format_epub_member(raw_bytes, name, indent_size=4):
+    """格式化 EPUB 中的一个 XHTML 成员，返回 (是否成功, 错误, 格式化后的字节, 控制台输出)"""
+    buffer = io.StringIO()
+    with redirect_stdout(buffer):
+        try:
+            content = format_xhtml_content(raw_bytes.decode('utf-8'), name, indent_size)
+            return True, None, content.encode('utf-8'), buffer.getvalue()
+        except Exception as e:
+            return False, f"解析失败: {str(e)}", None, buffer.getvalue()
+
+def format_epub_archive(epub_path, output_path, indent_size=4, jobs=1):
+    """直接格式化 EPUB：不解压到磁盘，返回失败的成员列表"""
+    errors = []
+    with zipfile.ZipFile(epub_path, 'r') as source:
+        package = EpubPackage.from_zip(source)
+        xhtml_paths = {item.path for item in package.items_by_path.values()
+                       if item.media_type == XHTML_MEDIA_TYPE}
+
+        # mimetype 由 write_epub_mimetype 重新写在最前面
+        members = [info for info in source.infolist() if not info.is_dir() and info.filename != 'mimetype']
+        xhtml_members = [info.filename for info in members
+                         if info.filename in xhtml_paths or info.filename.lower().endswith(('.xhtml', '.html'))]
+
+        print(f"📊📊 找到 {len(xhtml_members)} 个XHTML文件，{len(members) - len(xhtml_members)} 个其他资源")
+
+        raw_contents = [source.read(name) for name in xhtml_members]
+        display_names = [os.path.basename(name) for name in xhtml_members]
+        if jobs > 1 and len(xhtml_members) > 1:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=set_skip_title_patterns,
+                                     initargs=(active_skip_title_patterns,)) as executor:
+                chunksize = max(1, len(xhtml_members) // (jobs * 4))
+                results = list(executor.map(format_epub_member, raw_contents, display_names,
+                                            repeat(indent_size), chunksize=chunksize))
+        else:
+            results = [format_epub_member(raw, name, indent_size) for raw, name in zip(raw_contents, display_names)]
+
+        formatted = {}
+        for name, (success, error, content, output) in zip(xhtml_members, results):
+            print(output, end='')
+            if success:
+                print(f"✅ 成功: {name}")
+                formatted[name] = content
+            else:
+                # 格式化失败的文件原样保留
+                print(f"❌❌ 失败: {name} - {error}")
+                errors.append(name)
+
+        # 先写临时文件，完成后再替换，mimetype 不压缩且作为第一个条目
+        tmp_path = output_path + '.tmp'
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as target, \
+                open(epub_path, 'rb') as raw_src:
+            write_epub_mimetype(target)
+            for info in members:
+                if info.filename in formatted:
+                    zinfo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    target.writestr(zinfo, formatted[info.filename])
+                elif can_copy_raw(info):
+                    # 图片、CSS 等资源原样复制压缩数据
+                    copy_member_raw(raw_src, info, target, info.filename)
+                else:
+                    zinfo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    with source.open(info) as src, target.open(zinfo, 'w') as dst:
+                        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        os.replace(tmp_path, output_path)
+
+    return len(xhtml_members), errors
+
+def skip_patterns_version():
+    """当前生效的跳过规则的指纹，规则变化时缓存自动失效"""
+    return hashlib.sha256("\n".join(active_skip_title_patterns).encode('utf-8')).hexdigest()[:16]
+
+def format_settings_key(indent_size):
+    """缓存键中与源文件内容无关的部分：格式化版本、缩进、跳过规则"""
+    return f"v{FORMATTER_VERSION}:indent={indent_size}:skip={skip_patterns_version()}"
+
+def load_format_cache(output_dir):
+    try:
+        with open(os.path.join(output_dir, FORMAT_CACHE_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_format_cache(output_dir, cache):
+    cache_path = os.path.join(output_dir, FORMAT_CACHE_NAME)
+    with open(cache_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(cache_path + '.tmp', cache_path)
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def is_cache_hit(entry, source_hash, settings_key, output_path):
+    """源文件内容和设置都没变，且上次的输出没有被改动过"""
+    if not entry or entry.get('source_sha256') != source_hash or entry.get('settings') != settings_key:
+        return False
+    try:
+        stat = os.stat(output_path)
+    except OSError:
+        return False
+    return entry.get('output_size') == stat.st_size and entry.get('output_mtime_ns') == stat.st_mtime_ns
+
 def main():
     parser = argparse.ArgumentParser(description='EPUB XHTML文件批量格式化（按文件名排序）')
-    parser.add_argument('source_dir', help='源文件目录')
+    parser.add_argument('source_dir', help='源文件目录或 EPUB 文件')
     parser.add_argument('--indent', type=int, default=4, help='缩进空格数（默认4）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行处理的进程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--no-cache', action='store_true', help='忽略缓存，重新格式化所有文件')
+    parser.add_argument('--rules', help='追加跳过body格式化标题规则的 JSON 配置文件')
     args = parser.parse_args()
 
+    if args.rules:
+        set_skip_title_patterns(load_skip_title_patterns(args.rules))
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    # 直接处理 EPUB 文件
+    if os.path.isfile(args.source_dir) and args.source_dir.lower().endswith('.epub'):
+        epub_path = os.path.abspath(args.source_dir)
+        output_path = f"{os.path.splitext(epub_path)[0]}_formatted.epub"
+        print(f"🔍🔍 读取EPUB: {epub_path}")
+        print(f"📂📂 输出EPUB: {output_path}")
+        total, errors = format_epub_archive(epub_path, output_path, args.indent, jobs)
+        print(f"\n🎉🎉 完成！处理文件: {total - len(errors)}/{total} 个")
+        if errors:
+            print(f"⚠️ 失败文件: {', '.join(errors)}")
+        return
+
     # 创建输出目录
     source_dir = os.path.abspath(args.source_dir)
     base_name = os.path.basename(source_dir)
@@ -282,21 +464,65 @@ def main():
             file_list.append(filename)
 
     # 按文件名自然排序
-    file_list.sort(key=lambda f: [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', f)])
+    file_list.sort(key=natural_sort_key)
 
     print(f"📊📊 找到 {len(file_list)} 个文件，按文件名排序处理...")
 
+    # 内容和设置都没变的文件沿用上次的输出
+    cache = {} if args.no_cache else load_format_cache(output_dir)
+    settings_key = format_settings_key(args.indent)
+    source_hashes = {}
+    cached = set()
     for filename in file_list:
-        input_file = os.path.join(source_dir, filename)
-        output_file = os.path.join(output_dir, filename)
-
-        success, error = format_epub_xhtml_file(input_file, output_file, args.indent)
-
-        if success:
-            print(f"✅ 成功: {filename}")
+        source_hashes[filename] = file_sha256(os.path.join(source_dir, filename))
+        if is_cache_hit(cache.get(filename), source_hashes[filename], settings_key,
+                        os.path.join(output_dir, filename)):
+            cached.add(filename)
+
+    pending = [filename for filename in file_list if filename not in cached]
+    input_files = [os.path.join(source_dir, filename) for filename in pending]
+    output_files = [os.path.join(output_dir, filename) for filename in pending]
+
+    # 多进程时用 with 管理进程池，中途出错也会关闭；单进程时用 nullcontext 占位
+    parallel = jobs > 1 and len(pending) > 1
+    pool = (ProcessPoolExecutor(max_workers=jobs, initializer=set_skip_title_patterns,
+                                initargs=(active_skip_title_patterns,))
+            if parallel else nullcontext())
+    with pool as executor:
+        if executor is not None:
+            # executor.map 按提交顺序返回结果，输出顺序与单进程一致
+            chunksize = max(1, len(pending) // (jobs * 4))
+            results = executor.map(format_file_captured, input_files, output_files, repeat(args.indent),
+                                   chunksize=chunksize)
         else:
-            print(f"❌❌ 失败: {filename} - {error}")
-            errors.append(filename)
+            results = (format_epub_xhtml_file(input_file, output_file, args.indent) + ('',)
+                       for input_file, output_file in zip(input_files, output_files))
+
+        # 按自然排序顺序输出：缓存命中的直接报告，其余依次取格式化结果
+        results = iter(results)
+        for filename in file_list:
+            if filename in cached:
+                print(f"♻️ 未变化: {filename}")
+                continue
+
+            success, error, output = next(results)
+            print(output, end='')
+            if success:
+                print(f"✅ 成功: {filename}")
+                output_stat = os.stat(os.path.join(output_dir, filename))
+                cache[filename] = {
+                    'source_sha256': source_hashes[filename],
+                    'settings': settings_key,
+                    'output_size': output_stat.st_size,
+                    'output_mtime_ns': output_stat.st_mtime_ns,
+                }
+            else:
+                print(f"❌❌ 失败: {filename} - {error}")
+                errors.append(filename)
+                cache.pop(filename, None)
+
+    # 源目录中已不存在的文件不再保留缓存记录
+    save_format_cache(output_dir, {filename: cache[filename] for filename in file_list if filename in cache})
 
     print(f"\n🎉🎉 完成！处理文件: {len(file_list) - len(errors)}/{len(file_list)} 个")
     if errors:
@@ -0,0 +1,216 @@
+"""
+content.opf / toc.ncx 生成工具（替代 content_opf_generate.sh 与 toc_ncx_generate.sh）
+功能：
+1. 读取 XHTML 文件夹（通常是 OEBPS/Text），按文件名自然排序
+2. 从每个文件的<title>提取章节标题（与 format-xhtml 使用同一套提取逻辑）
+3. 在文件夹的父目录生成 content.opf（manifest + spine）和 toc.ncx（卷/部/番外 → 章 两级目录）
+4. 两个文件共用同一个 UUID
+"""
+import os
+import re
+import sys
+import uuid
+import argparse
+from html import unescape
+from lxml import etree
+from format_xhtml import natural_sort_key, extract_title_from_raw_content
+
+OPF_NS = "http://www.idpf.org/2007/opf"
+DC_NS = "http://purl.org/dc/elements/1.1/"
+NCX_NS = "http://www.daisy.org/z3986/2005/ncx/"
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+NCX_XML_DECLARATION = '<?xml version="1.0" encoding="utf-8" standalone="no"?>'
+NCX_DOCTYPE = '<!DOCTYPE ncx PUBLIC "-//NISO//DTD ncx 2005-1//EN" "http://www.daisy.org/z3986/2005/ncx-2005-1.dtd">'
+
+# content.opf 骨架：manifest 中固定的 toc、cover、css 在前，章节追加在后
+OPF_TEMPLATE = f"""<package xmlns="{OPF_NS}" version="2.0" unique-identifier="uuid_id">
+<metadata xmlns:opf="{OPF_NS}" xmlns:dc="{DC_NS}">
+<dc:identifier opf:scheme="uuid" id="uuid_id"></dc:identifier>
+<dc:title></dc:title>
+<dc:creator opf:role="aut" opf:file-as=""></dc:creator>
+<dc:description></dc:description>
+<dc:subject></dc:subject>
+<dc:subject></dc:subject>
+<dc:subject></dc:subject>
+<dc:subject></dc:subject>
+<dc:date></dc:date>
+<dc:language>zh-CN</dc:language>
+<dc:format>application/epub+zip</dc:format>
+<dc:type>novel</dc:type>
+<meta name="cover" content="cover"/>
+</metadata>
+<manifest>
+<item id="toc" href="toc.ncx" media-type="application/x-dtbncx+xml"/>
+<item id="cover" href="cover.jpg" media-type="image/jpeg"/>
+<item id="style" href="style.css" media-type="text/css"/>
+</manifest>
+<spine toc="toc">
+<itemref idref="cover" linear="no"/>
+</spine>
+</package>"""
+
+# 目录层级判断：卷/部、番外与卷同级，章归属于最近的卷
+VOLUME_PATTERN = re.compile(r'^第[^ ]+[卷部](\s|$)')
+EXTRA_PATTERN = re.compile(r'^番外(\s|$)')
+CHAPTER_PATTERN = re.compile(r'^第[^ ]+章(\s|$)')
+
+def chapter_title(content):
+    """章节标题（<title> 文本，已还原实体），没有时返回 None"""
+    title = extract_title_from_raw_content(content)
+    return unescape(title) if title else None
+
+def list_chapter_files(xhtml_dir):
+    """文件夹中的 XHTML 文件名，按自然排序"""
+    return sorted((f for f in os.listdir(xhtml_dir) if f.lower().endswith('.xhtml')), key=natural_sort_key)
+
+def collect_chapters(xhtml_dir):
+    """读取文件夹中的 XHTML 文件，返回按自然排序的 [(文件名, 标题), ...]，标题缺失时为 None"""
+    chapters = []
+    for filename in list_chapter_files(xhtml_dir):
+        with open(os.path.join(xhtml_dir, filename), 'r', encoding='utf-8', errors='ignore') as f:
+            chapters.append((filename, chapter_title(f.read())))
+    return chapters
+
+def build_content_opf(filenames, text_folder, book_uuid, has_cover=True, extra_items=()):
+    """生成 content.opf 内容：固定的 toc/cover/style 项加上所有章节
+
+    has_cover 为 False 时去掉封面相关的 meta、manifest 项和 itemref
+    extra_items 为额外资源 [(id, href, media-type), ...]，放在章节之前
+    """
+    # 从模板解析，保留 metadata 上的 opf/dc 前缀，manifest/spine 使用默认命名空间
+    package = etree.fromstring(OPF_TEMPLATE)
+    package.find(f"{{{OPF_NS}}}metadata/{{{DC_NS}}}identifier").text = book_uuid
+    manifest = package.find(f"{{{OPF_NS}}}manifest")
+    spine = package.find(f"{{{OPF_NS}}}spine")
+
+    if not has_cover:
+        for element in package.xpath('//opf:meta[@name="cover"] | //opf:item[@id="cover"] | //opf:itemref[@idref="cover"]',
+                                     namespaces={"opf": OPF_NS}):
+            element.getparent().remove(element)
+
+    for item_id, href, media_type in extra_items:
+        etree.SubElement(manifest, f"{{{OPF_NS}}}item", attrib={"id": item_id, "href": href, "media-type": media_type})
+
+    for filename in filenames:
+        item_id = os.path.splitext(filename)[0]
+        etree.SubElement(manifest, f"{{{OPF_NS}}}item",
+                         attrib={"id": item_id, "href": f"{text_folder}/{filename}",
+                                 "media-type": "application/xhtml+xml"})
+        etree.SubElement(spine, f"{{{OPF_NS}}}itemref", attrib={"idref": item_id, "linear": "yes"})
+
+    etree.indent(package, space="    ")
+    body = etree.tostring(package, encoding="utf-8").decode("utf-8")
+    return f"{XML_DECLARATION}\n{body}\n"
+
+def add_nav_point(parent, nav_id, play_order, title, src):
+    nav_point = etree.SubElement(parent, f"{{{NCX_NS}}}navPoint", attrib={"id": nav_id, "playOrder": str(play_order)})
+    nav_label = etree.SubElement(nav_point, f"{{{NCX_NS}}}navLabel")
+    etree.SubElement(nav_label, f"{{{NCX_NS}}}text").text = title
+    etree.SubElement(nav_point, f"{{{NCX_NS}}}content", attrib={"src": src})
+    return nav_point
+
+def build_toc_ncx(chapters, text_folder, book_uuid):
+    """生成 toc.ncx 内容，返回 (内容, 统计信息)"""
+    ncx = etree.Element(f"{{{NCX_NS}}}ncx", nsmap={None: NCX_NS}, attrib={"version": "2005-1"})
+    head = etree.SubElement(ncx, f"{{{NCX_NS}}}head")
+    depth_meta = None
+    for name, content in (("dtb:uid", book_uuid), ("dtb:depth", "1"),
+                          ("dtb:totalPageCount", "0"), ("dtb:maxPageNumber", "0")):
+        meta = etree.SubElement(head, f"{{{NCX_NS}}}meta", attrib={"name": name, "content": content})
+        if name == "dtb:depth":
+            depth_meta = meta
+    doc_title = etree.SubElement(ncx, f"{{{NCX_NS}}}docTitle")
+    etree.SubElement(doc_title, f"{{{NCX_NS}}}text").text = "目录"
+    nav_map = etree.SubElement(ncx, f"{{{NCX_NS}}}navMap")
+
+    # 章节ID宽度取总章节数的位数
+    chapter_width = max(1, len(str(len(chapters))))
+    stats = {"volumes": 0, "volume_parts": 0, "extras": 0, "chapters": 0, "chapter_width": chapter_width}
+    current_volume = None
+    play_order = 0
+
+    for filename, title in chapters:
+        if not title:
+            print(f"警告: 无法从文件 '{filename}' 中提取标题，已跳过")
+            continue
+
+        play_order += 1
+        src = f"{text_folder}/{filename}"
+
+        is_volume = VOLUME_PATTERN.match(title) is not None
+        if is_volume or EXTRA_PATTERN.match(title):
+            # 卷、部、番外统一使用 volume_ 前缀，与卷同级
+            stats["volumes"] += 1
+            stats["volume_parts" if is_volume else "extras"] += 1
+            current_volume = add_nav_point(nav_map, f"volume_{stats['volumes']:02d}", play_order, title, src)
+            continue
+
+        if not CHAPTER_PATTERN.match(title):
+            print(f"注意: 文件 '{filename}' 的标题 '{title}' 无法分辨类型，当作章节处理")
+
+        # 有当前卷/番外时章节属于它，否则直接作为 navMap 子节点
+        stats["chapters"] += 1
+        add_nav_point(current_volume if current_volume is not None else nav_map,
+                      f"chapter_{stats['chapters']:0{chapter_width}d}", play_order, title, src)
+
+    depth_meta.set("content", "2" if stats["volumes"] > 0 else "1")
+
+    etree.indent(ncx, space="    ")
+    body = etree.tostring(ncx, encoding="utf-8").decode("utf-8")
+    return f"{NCX_XML_DECLARATION}\n{NCX_DOCTYPE}\n{body}\n", stats
+
+def generate_opf_ncx(xhtml_dir, book_uuid=None):
+    """在 XHTML 文件夹的父目录生成 content.opf 和 toc.ncx，返回统计信息"""
+    xhtml_dir = os.path.abspath(xhtml_dir)
+    parent_dir = os.path.dirname(xhtml_dir)
+    text_folder = os.path.basename(xhtml_dir)
+    book_uuid = book_uuid or str(uuid.uuid4())
+
+    chapters = collect_chapters(xhtml_dir)
+    if not chapters:
+        raise ValueError(f"在 '{xhtml_dir}' 中未找到任何 xhtml 文件")
+
+    opf_content = build_content_opf([filename for filename, _ in chapters], text_folder, book_uuid)
+    ncx_content, stats = build_toc_ncx(chapters, text_folder, book_uuid)
+
+    with open(os.path.join(parent_dir, "content.opf"), "w", encoding="utf-8") as f:
+        f.write(opf_content)
+    with open(os.path.join(parent_dir, "toc.ncx"), "w", encoding="utf-8") as f:
+        f.write(ncx_content)
+
+    print(f"已生成: {os.path.join(parent_dir, 'content.opf')}")
+    print(f"已生成: {os.path.join(parent_dir, 'toc.ncx')}")
+    print(f"使用的UUID: {book_uuid}")
+    return stats
+
+def print_stats(stats):
+    print("目录包含:")
+    if stats["volumes"] > 0:
+        if stats["volume_parts"] > 0 and stats["extras"] > 0:
+            print(f" - {stats['volumes']} 个分部 ({stats['volume_parts']} 个卷/部 + {stats['extras']} 个番外)")
+        elif stats["extras"] > 0:
+            print(f" - {stats['volumes']} 个番外")
+        else:
+            print(f" - {stats['volumes']} 个分卷/分部")
+    print(f" - {stats['chapters']} 个章节 (ID宽度: {stats['chapter_width']})")
+
+def main():
+    parser = argparse.ArgumentParser(description='根据 XHTML 文件夹生成 content.opf 和 toc.ncx')
+    parser.add_argument('xhtml_dir', help='XHTML 文件夹路径（如 OEBPS/Text），结果写入其父目录')
+    parser.add_argument('--uuid', help='指定书籍 UUID（默认随机生成）')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.xhtml_dir):
+        print(f"错误: 文件夹 '{args.xhtml_dir}' 不存在")
+        sys.exit(1)
+
+    try:
+        stats = generate_opf_ncx(args.xhtml_dir, args.uuid)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print_stats(stats)
+
+if __name__ == '__main__':
+    main()
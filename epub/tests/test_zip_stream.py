@@ -0,0 +1,83 @@
+"""
+zip_stream 原样复制的回归测试：输出必须能通过 zipfile.testzip()
+原样写入依赖 zipfile 的内部实现，需要在每个支持的 Python 版本上运行:
+    uv run --python 3.13 python -m unittest discover -s tests
+    uv run --python 3.14 python -m unittest discover -s tests
+"""
+import io
+import os
+import sys
+import unittest
+import zipfile
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import zip_stream
+from zip_stream import copy_member_raw, supports_raw_write, RAW_WRITE_VERSIONS
+
+PAYLOAD = os.urandom(4096) + b'manga ' * 20000
+
+def make_source():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as source:
+        source.writestr('deflated.bin', PAYLOAD, zipfile.ZIP_DEFLATED)
+        source.writestr('stored.bin', PAYLOAD, zipfile.ZIP_STORED)
+        source.writestr('empty.txt', b'', zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+class CopyMemberRawTest(unittest.TestCase):
+
+    def copy_all(self, source_bytes, prefix='copy/'):
+        output = io.BytesIO()
+        with zipfile.ZipFile(io.BytesIO(source_bytes)) as source, \
+                zipfile.ZipFile(output, 'w') as target:
+            raw_src = io.BytesIO(source_bytes)
+            # 与 writestr 交替写入，确认内部写入状态保持一致
+            target.writestr('before.txt', b'before')
+            for info in source.infolist():
+                copy_member_raw(raw_src, info, target, prefix + info.filename)
+            target.writestr('after.txt', b'after', zipfile.ZIP_DEFLATED)
+        return output.getvalue()
+
+    def assert_valid(self, output_bytes):
+        with zipfile.ZipFile(io.BytesIO(output_bytes)) as output:
+            self.assertIsNone(output.testzip())
+            self.assertEqual(output.namelist(), ['before.txt', 'copy/deflated.bin', 'copy/stored.bin',
+                                                 'copy/empty.txt', 'after.txt'])
+            self.assertEqual(output.read('copy/deflated.bin'), PAYLOAD)
+            self.assertEqual(output.read('copy/stored.bin'), PAYLOAD)
+            self.assertEqual(output.read('after.txt'), b'after')
+            return {info.filename: info for info in output.infolist()}
+
+    def test_supported_version_uses_raw_write(self):
+        with zipfile.ZipFile(io.BytesIO(), 'w') as target:
+            expected = sys.version_info[:2] in RAW_WRITE_VERSIONS
+            self.assertEqual(supports_raw_write(target), expected)
+
+    def test_copy_keeps_compressed_data(self):
+        source_bytes = make_source()
+        infos = self.assert_valid(self.copy_all(source_bytes))
+        with zipfile.ZipFile(io.BytesIO(source_bytes)) as source:
+            for info in source.infolist():
+                copied = infos['copy/' + info.filename]
+                self.assertEqual(copied.compress_type, info.compress_type)
+                self.assertEqual(copied.CRC, info.CRC)
+                if sys.version_info[:2] in RAW_WRITE_VERSIONS:
+                    self.assertEqual(copied.compress_size, info.compress_size)
+
+    def test_fallback_without_internals(self):
+        with mock.patch.object(zip_stream, 'supports_raw_write', return_value=False):
+            self.assert_valid(self.copy_all(make_source()))
+
+    def test_rejects_open_write_handle(self):
+        source_bytes = make_source()
+        with zipfile.ZipFile(io.BytesIO(source_bytes)) as source, \
+                zipfile.ZipFile(io.BytesIO(), 'w') as target:
+            info = source.getinfo('stored.bin')
+            with target.open('open.txt', 'w'):
+                with self.assertRaises(ValueError):
+                    copy_member_raw(io.BytesIO(source_bytes), info, target, 'copy.bin')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,45 +1,279 @@
 import os
+import hashlib
+import json
 import shutil
 import subprocess
 import sys
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from tempfile import TemporaryDirectory
+from PIL import Image
 
-def convert_images(input_folder, out_format):
+# 支持的图片格式
+INPUT_EXTS = ('.webp', '.avif', '.png', '.jpeg', '.jpg')
+
+# 各输出格式的默认编码参数（Pillow 后端）
+# quality: 画质；effort: 压缩力度（webp 对应 method 0-6，avif 对应 speed 0-10 取反，png 对应 compress_level 0-9）
+DEFAULT_ENCODER_SETTINGS = {
+    'jpg': {'quality': 92},
+    'jpeg': {'quality': 92},
+    'webp': {'quality': 90, 'effort': 4},
+    'avif': {'quality': 75, 'effort': 4},
+    'png': {'effort': 6},
+}
+
+# 增量模式下保存在输出文件夹中的清单文件
+MANIFEST_NAME = '.convert_manifest.json'
+
+# 转换后仍需保留的 info 字段（不属于元数据，删除会改变画面）
+PRESERVED_INFO_KEYS = ('transparency',)
+
+def encoder_settings(out_format, quality=None, effort=None):
+    """合并默认参数与命令行指定的 quality / effort"""
+    settings = dict(DEFAULT_ENCODER_SETTINGS.get(out_format, {}))
+    if quality is not None:
+        settings['quality'] = quality
+    if effort is not None:
+        settings['effort'] = effort
+    return settings
+
+def pillow_save_options(out_format, settings):
+    """把 quality / effort 转换成 Pillow 对应格式的保存参数"""
+    options = {}
+    if 'quality' in settings and out_format != 'png':
+        options['quality'] = settings['quality']
+    effort = settings.get('effort')
+    if effort is not None:
+        if out_format == 'webp':
+            options['method'] = max(0, min(6, effort))
+        elif out_format == 'avif':
+            options['speed'] = max(0, min(10, 10 - effort))
+        elif out_format == 'png':
+            options['compress_level'] = max(0, min(9, effort))
+    if out_format in ('jpg', 'jpeg'):
+        options['optimize'] = True
+    return options
+
+def strip_metadata(img):
+    """去除 EXIF / ICC / XMP / 注释等元数据，效果等同于 magick -strip"""
+    img.info = {key: img.info[key] for key in PRESERVED_INFO_KEYS if key in img.info}
+    return img
+
+def prepare_mode(img, out_format):
+    """转换为目标格式支持的色彩模式"""
+    has_alpha = 'A' in img.mode or 'transparency' in img.info
+    if out_format in ('jpg', 'jpeg'):
+        if img.mode not in ('RGB', 'L', 'CMYK'):
+            return img.convert('RGB')
+    elif out_format in ('webp', 'avif'):
+        if img.mode not in ('RGB', 'RGBA'):
+            return img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+def convert_with_pillow(input_path, output_path, out_format, settings):
+    with Image.open(input_path) as img:
+        img.load()
+        img = prepare_mode(strip_metadata(img), out_format)
+        img.save(output_path, **pillow_save_options(out_format, settings))
+
+def convert_with_magick(input_path, output_path, out_format, settings):
+    # 使用imagemagick的magick命令进行转换，并去除 profile 和 metadata
+    command = ["magick", input_path, "-strip"]
+    if 'quality' in settings and out_format != 'png':
+        command += ["-quality", str(settings['quality'])]
+    # effort 与 Pillow 后端取同样的映射，--benchmark 比较两个后端时参数一致
+    effort = settings.get('effort')
+    if effort is not None:
+        if out_format == 'webp':
+            command += ["-define", f"webp:method={max(0, min(6, effort))}"]
+        elif out_format == 'avif':
+            # ImageMagick 的 AVIF 由 heic 编码器处理，speed 范围 0-9
+            command += ["-define", f"heic:speed={max(0, min(9, 10 - effort))}"]
+        elif out_format == 'png':
+            command += ["-define", f"png:compression-level={max(0, min(9, effort))}"]
+    command.append(output_path)
+    subprocess.run(command, check=True)
+
+BACKENDS = {
+    'pillow': convert_with_pillow,
+    'magick': convert_with_magick,
+}
+
+def convert_file(input_path, output_path, out_format, backend, settings):
+    """转换单个文件，返回是否成功"""
+    try:
+        BACKENDS[backend](input_path, output_path, out_format, settings)
+        print(f"✅ 转换成功: {input_path} -> {output_path}")
+        return True
+    except Exception as e:
+        print(f"❌ 转换失败: {os.path.basename(input_path)}，错误: {e}")
+        return False
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def load_manifest(output_folder):
+    """读取增量清单，不存在或损坏时返回空清单"""
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_folder, manifest):
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def is_up_to_date(entry, input_path, output_path, encoder, stat):
+    """判断输出是否仍然有效：编码参数一致、输出存在、源文件大小/时间一致或内容哈希一致"""
+    if not entry or entry.get('encoder') != encoder or not os.path.exists(output_path):
+        return False
+    if entry.get('size') != stat.st_size:
+        return False
+    if entry.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    # 修改时间变了（例如被 touch 或重新解压），再用内容哈希确认
+    if entry.get('sha256') == file_sha256(input_path):
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+    return False
+
+def remove_orphans(output_folder, expected_outputs):
+    """删除输出文件夹中已没有对应源文件的输出"""
+    for filename in os.listdir(output_folder):
+        if filename == MANIFEST_NAME or filename in expected_outputs:
+            continue
+        path = os.path.join(output_folder, filename)
+        if os.path.isfile(path):
+            os.remove(path)
+            print(f"🗑️ 删除孤立输出: {filename}")
+
+def convert_images(input_folder, out_format, backend='pillow', jobs=1, quality=None, effort=None,
+                   output_folder=None, incremental=False):
+    """批量转换图片格式，返回成功转换的文件数
+
+    incremental 为 True 时保留输出文件夹，只转换新增或变化的图片，并删除孤立的输出
+    """
     # 获取输出文件夹路径
-    base_dir = os.path.dirname(os.path.abspath(input_folder))
-    folder_name = os.path.basename(os.path.abspath(input_folder))
-    output_folder = os.path.join(base_dir, f"{folder_name}_{out_format}")
+    if output_folder is None:
+        base_dir = os.path.dirname(os.path.abspath(input_folder))
+        folder_name = os.path.basename(os.path.abspath(input_folder))
+        output_folder = os.path.join(base_dir, f"{folder_name}_{out_format}")
 
-    # 如果输出文件夹存在，删除后重新创建
-    if os.path.exists(output_folder):
-        shutil.rmtree(output_folder)
-    os.makedirs(output_folder)
+    if incremental:
+        os.makedirs(output_folder, exist_ok=True)
+        old_manifest = load_manifest(output_folder)
+    else:
+        # 如果输出文件夹存在，删除后重新创建
+        if os.path.exists(output_folder):
+            shutil.rmtree(output_folder)
+        os.makedirs(output_folder)
+        old_manifest = {}
 
-    # 支持的图片格式
-    exts = ('.webp', '.avif', '.png', '.jpeg', '.jpg')
+    settings = encoder_settings(out_format, quality, effort)
+    # 编码参数也记录进清单，参数变化时全部重新转换
+    encoder = {'format': out_format, 'backend': backend, 'settings': settings}
 
     # 遍历输入文件夹
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(exts):
-            input_path = os.path.join(input_folder, filename)
+    manifest = {}
+    input_paths = []
+    output_paths = []
+    skipped = 0
+    for filename in sorted(os.listdir(input_folder)):
+        if filename.lower().endswith(INPUT_EXTS):
             name, _ = os.path.splitext(filename)
+            input_path = os.path.join(input_folder, filename)
             output_path = os.path.join(output_folder, f"{name}.{out_format}")
 
-            # 使用imagemagick的magick命令进行转换，并去除 profile 和 metadata
-            try:
-                subprocess.run([
-                    "magick", input_path, "-strip", output_path
-                ], check=True)
-                print(f"✅ 转换成功: {input_path} -> {output_path}")
-            except subprocess.CalledProcessError as e:
-                print(f"❌ 转换失败: {filename}，错误: {e}")
+            if incremental:
+                stat = os.stat(input_path)
+                entry = old_manifest.get(filename)
+                if is_up_to_date(entry, input_path, output_path, encoder, stat):
+                    manifest[filename] = entry
+                    skipped += 1
+                    continue
+
+            input_paths.append(input_path)
+            output_paths.append(output_path)
+
+    task_args = (input_paths, output_paths, repeat(out_format), repeat(backend), repeat(settings))
+
+    if jobs > 1 and len(input_paths) > 1:
+        # Pillow 编解码是 CPU 密集型，用多进程；magick 本身就是子进程，用线程调度即可
+        executor_class = ProcessPoolExecutor if backend == 'pillow' else ThreadPoolExecutor
+        chunksize = max(1, len(input_paths) // (jobs * 4))
+        with executor_class(max_workers=jobs) as executor:
+            results = list(executor.map(convert_file, *task_args, chunksize=chunksize))
+    else:
+        results = list(map(convert_file, *task_args))
+
+    if incremental:
+        for input_path, output_path, success in zip(input_paths, output_paths, results):
+            if not success:
+                continue
+            stat = os.stat(input_path)
+            manifest[os.path.basename(input_path)] = {
+                'output': os.path.basename(output_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha256': file_sha256(input_path),
+                'encoder': encoder,
+            }
+        remove_orphans(output_folder, {entry['output'] for entry in manifest.values()}
+                       | {os.path.basename(path) for path in output_paths})
+        save_manifest(output_folder, manifest)
+        print(f"📊 跳过未变化 {skipped} 个，转换 {sum(results)}/{len(input_paths)} 个")
+
+    return sum(results)
+
+def benchmark_backends(input_folder, out_format, jobs=1, quality=None, effort=None):
+    """分别用各后端转换同一批图片，比较每秒转换的文件数"""
+    for backend in BACKENDS:
+        if backend == 'magick' and not shutil.which('magick'):
+            print("⚠️ 未找到 magick，跳过 magick 后端")
+            continue
+        with TemporaryDirectory() as output_folder:
+            start_time = time.perf_counter()
+            count = convert_images(input_folder, out_format, backend, jobs, quality, effort,
+                                   output_folder=os.path.join(output_folder, out_format))
+            elapsed = time.perf_counter() - start_time
+        files_per_second = count / elapsed if elapsed > 0 else 0.0
+        print(f"📊 {backend}: {count} 个文件，耗时 {elapsed:.2f} 秒，{files_per_second:.1f} 个/秒")
 
 def main():
-    if len(sys.argv) != 3:
-        print("用法: python convert_image_format_to_jpg.py <输出图片格式> <图片文件夹路径>")
+    parser = argparse.ArgumentParser(description='批量转换图片格式（去除元数据）')
+    parser.add_argument('out_format', help='输出图片格式，如 jpg / webp / avif / png')
+    parser.add_argument('input_folder', help='图片文件夹路径')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='pillow',
+                        help='转换后端（默认 pillow 进程内转换，magick 为每个文件调用一次 magick）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行转换的进程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--quality', type=int, help='输出画质（默认按格式选择）')
+    parser.add_argument('--effort', type=int, help='压缩力度（webp 0-6，avif 0-10，png 0-9）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量转换：保留输出文件夹，只转换新增或变化的图片并删除孤立输出')
+    parser.add_argument('--benchmark', action='store_true', help='比较各后端的转换速度（输出到临时目录）')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_folder):
+        print(f"错误: 目录 '{args.input_folder}' 不存在")
         sys.exit(1)
-    out_format = sys.argv[1].lower()
-    input_folder = sys.argv[2]
-    convert_images(input_folder, out_format)
+
+    out_format = args.out_format.lower()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    if args.benchmark:
+        benchmark_backends(args.input_folder, out_format, jobs, args.quality, args.effort)
+    else:
+        convert_images(args.input_folder, out_format, args.backend, jobs, args.quality, args.effort,
+                       incremental=args.incremental)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,43 +1,136 @@
+import io
 import os
 import sys
 import argparse
 import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from PIL import Image
+from image_probe import probe_image_size, read_jpeg_sof, is_lossless_webp
+from gutter_detect import find_gutter
+
+# jpegtran（libjpeg-turbo）可以在 DCT 域按 MCU 边界无损裁剪 JPEG
+JPEGTRAN = shutil.which('jpegtran')
+
+# 中缝检测置信度低于该值的双页视为无法判断
+DEFAULT_MIN_CONFIDENCE = 0.35
+
+# 无法判断的双页的处理方式：copy 原样复制不拆分，center 仍按中间拆分
+AMBIGUOUS_MODES = ('copy', 'center')
 
 def is_double_page(image_path):
-    """判断图片是否为双页：只要宽度大于高度就判定为双页"""
+    """判断图片是否为双页：只要宽度大于高度就判定为双页（只读取文件头，不解码）"""
     try:
-        with Image.open(image_path) as img:
-            width, height = img.size
-            # 宽度大于高度即视为双页
-            return width > height
+        width, height = probe_image_size(image_path)
+        # 宽度大于高度即视为双页
+        return width > height
     except Exception as e:
         print(f"分析图片 {image_path} 时出错: {e}")
         return False
 
-def split_double_page(image_path, output_dir):
-    """将双页图片拆分为单页，右侧图片文件名在前"""
+def mcu_width_from_sof(sof):
+    """由 SOF 段计算 JPEG 的 MCU 宽度（像素），无法识别时返回 None"""
+    if not sof or not sof[2]:
+        return None
+    components = sof[2]
+    # 单通道图片不交错存储，MCU 固定为 8x8
+    if len(components) == 1:
+        return 8
+    return 8 * max(h_sampling for _, h_sampling, _ in components)
+
+def jpeg_mcu_width(image_path):
+    """读取 JPEG 的 MCU 宽度（像素），无法识别时返回 None"""
+    with open(image_path, 'rb') as f:
+        return mcu_width_from_sof(read_jpeg_sof(f))
+
+def lossless_split_pos(width, mcu_width, split_pos=None):
+    """无损裁剪的分割点：中间位置，或吸附到最近 MCU 边界的检测结果；右页起点无法对齐 MCU 时返回 None"""
+    pos = width // 2
+    if split_pos is not None and mcu_width:
+        pos = round(split_pos / mcu_width) * mcu_width
+    if mcu_width and pos % mcu_width == 0 and 0 < pos < width:
+        return pos
+    return None
+
+def jpegtran_crops(width, height, split_pos):
+    """jpegtran 的裁剪参数：(右页, 左页)"""
+    return f"{width - split_pos}x{height}+{split_pos}+0", f"{split_pos}x{height}+0+0"
+
+def split_jpeg_lossless(image_path, right_path, left_path, width, height, split_pos):
+    """用 jpegtran 在 DCT 域裁剪左右两页，不经过解码/重新编码"""
+    for crop, output_path in zip(jpegtran_crops(width, height, split_pos), (right_path, left_path)):
+        subprocess.run([JPEGTRAN, "-copy", "none", "-crop", crop, "-outfile", output_path, image_path], check=True)
+
+def split_jpeg_bytes_lossless(data, split_pos=None):
+    """在内存中无损拆分 JPEG（jpegtran 从 stdin 读、向 stdout 写），返回 (右页字节, 左页字节)
+
+    分割点无法对齐 MCU 时返回 None；jpegtran 失败时抛出 CalledProcessError / OSError
+    """
+    sof = read_jpeg_sof(io.BytesIO(data))
+    if not sof:
+        return None
+    width, height = sof[:2]
+    pos = lossless_split_pos(width, mcu_width_from_sof(sof), split_pos)
+    if pos is None:
+        return None
+    return tuple(subprocess.run([JPEGTRAN, "-copy", "none", "-crop", crop], input=data,
+                                capture_output=True, check=True).stdout
+                 for crop in jpegtran_crops(width, height, pos))
+
+def split_double_page(image_path, output_dir, lossless=False, split_pos=None):
+    """将双页图片拆分为单页，右侧图片文件名在前
+
+    split_pos 为中缝检测得到的分割点，不指定时按中间位置分割
+    lossless 为 True 时，JPEG 在分割点对齐 MCU 边界的情况下无损裁剪，否则回退到解码后重新编码
+    （检测得到的分割点本身只是估计值，会先吸附到最近的 MCU 边界）
+    """
     try:
+        # 获取文件名和扩展名
+        filename = os.path.basename(image_path)
+        name, ext = os.path.splitext(filename)
+
+        # 保存分割后的图片，右侧用01，左侧用02，确保右侧在前
+        right_path = os.path.join(output_dir, f"{name}_01{ext}")  # 右侧图片
+        left_path = os.path.join(output_dir, f"{name}_02{ext}")   # 左侧图片
+
+        if lossless and JPEGTRAN and ext.lower() in ('.jpg', '.jpeg'):
+            width, height = probe_image_size(image_path)
+            mcu_width = jpeg_mcu_width(image_path)
+            # 计算分割点（中间位置，或吸附到 MCU 边界的检测结果）；只有右页的起点落在 MCU 边界上才能无损裁剪
+            lossless_pos = lossless_split_pos(width, mcu_width, split_pos)
+            if lossless_pos is not None:
+                try:
+                    split_jpeg_lossless(image_path, right_path, left_path, width, height, lossless_pos)
+                    print(f"已无损拆分: {filename} -> {os.path.basename(right_path)} (右) 和 {os.path.basename(left_path)} (左)")
+                    return True
+                except (subprocess.CalledProcessError, OSError) as e:
+                    # jpegtran 失败或不可执行：删除可能残留的半成品，回退到重新编码
+                    for partial_path in (right_path, left_path):
+                        if os.path.exists(partial_path):
+                            os.remove(partial_path)
+                    print(f"jpegtran 无损拆分失败（{e}），回退到重新编码: {filename}")
+            else:
+                print(f"分割点未对齐 MCU（{mcu_width}px），回退到重新编码: {filename}")
+
         with Image.open(image_path) as img:
             width, height = img.size
 
             # 计算分割点（中间位置）
-            split_pos = width // 2
+            if split_pos is None:
+                split_pos = width // 2
 
             # 分割为左右两页
             left_page = img.crop((0, 0, split_pos, height))
             right_page = img.crop((split_pos, 0, width, height))
 
-            # 获取文件名和扩展名
-            filename = os.path.basename(image_path)
-            name, ext = os.path.splitext(filename)
-
-            # 保存分割后的图片，右侧用01，左侧用02，确保右侧在前
-            right_path = os.path.join(output_dir, f"{name}_01{ext}")  # 右侧图片
-            left_path = os.path.join(output_dir, f"{name}_02{ext}")   # 左侧图片
-
-            right_page.save(right_path)
-            left_page.save(left_path)
+            # WebP 默认按有损保存，无损的源文件拆分后仍保存为无损
+            save_options = {}
+            if ext.lower() == '.webp':
+                save_options = {'lossless': True} if is_lossless_webp(image_path) else {'quality': 90}
+            right_page.save(right_path, **save_options)
+            left_page.save(left_path, **save_options)
 
             print(f"已拆分: {filename} -> {os.path.basename(right_path)} (右) 和 {os.path.basename(left_path)} (左)")
             return True
@@ -45,8 +138,56 @@ def split_double_page(image_path, output_dir):
         print(f"拆分图片 {image_path} 时出错: {e}")
         return False
 
-def process_directory(input_dir):
-    """处理目录中的所有图片"""
+def copy_single_page(file_path, output_dir):
+    """单页（或不拆分的页面）原样复制，返回输出的页数"""
+    filename = os.path.basename(file_path)
+
+    # 单页图片直接复制到输出目录，保持原文件名，不经过 Pillow
+    try:
+        dest_path = os.path.join(output_dir, filename)
+        shutil.copy2(file_path, dest_path)
+        print(f"复制单页图片: {filename}")
+        return 1
+    except Exception as e:
+        print(f"复制单页图片 {filename} 时出错: {e}")
+        return 0
+
+def decide_split(image_source, filename, gutter=False, min_confidence=DEFAULT_MIN_CONFIDENCE, ambiguous='copy'):
+    """决定双页怎么拆分，返回 (是否拆分, 分割点, 无法判断时的中缝置信度)；分割点为 None 表示按中间拆分
+
+    gutter 为 True 时先检测中缝：在中缝处拆分；置信度不足的按 ambiguous 处理并报告
+    image_source 可以是文件路径，也可以是已读入内存的文件对象
+    """
+    if not gutter:
+        return True, None, None
+    try:
+        gutter_pos, confidence = find_gutter(image_source)
+    except Exception as e:
+        print(f"检测中缝 {filename} 时出错: {e}")
+        gutter_pos, confidence = None, 0.0
+    if confidence < min_confidence:
+        if ambiguous == 'copy':
+            print(f"无法判断中缝（置信度 {confidence:.2f}），不拆分: {filename}")
+            return False, None, confidence
+        print(f"无法判断中缝（置信度 {confidence:.2f}），按中间拆分: {filename}")
+        return True, None, confidence
+    return True, gutter_pos, None
+
+def process_page(file_path, output_dir, double_page, lossless=False, gutter=False,
+                 min_confidence=DEFAULT_MIN_CONFIDENCE, ambiguous='copy'):
+    """处理单张图片：双页拆分，单页直接复制，返回 (输出的页数, 无法判断时的中缝置信度)"""
+    if double_page:
+        split, split_pos, confidence = decide_split(file_path, os.path.basename(file_path),
+                                                    gutter, min_confidence, ambiguous)
+        if not split:
+            return copy_single_page(file_path, output_dir), confidence
+        return (2 if split_double_page(file_path, output_dir, lossless, split_pos) else 0), confidence
+
+    return copy_single_page(file_path, output_dir), None
+
+def process_directory(input_dir, jobs=1, lossless=False, gutter=False,
+                      min_confidence=DEFAULT_MIN_CONFIDENCE, ambiguous='copy'):
+    """处理目录中的所有图片，jobs > 1 时使用多进程并行处理"""
     # 获取输入目录的父目录和名称
     input_parent = os.path.dirname(input_dir)
     input_basename = os.path.basename(input_dir)
@@ -57,25 +198,47 @@ def process_directory(input_dir):
     os.makedirs(output_dir, exist_ok=True)
 
     # 支持的图片格式
-    supported_formats = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff')
+    supported_formats = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp')
 
-    # 遍历目录中的所有文件
-    for filename in os.listdir(input_dir):
+    # 收集目录中的图片文件（排序保证处理顺序稳定）
+    page_files = []
+    for filename in sorted(os.listdir(input_dir)):
         file_path = os.path.join(input_dir, filename)
 
         # 只处理文件和支持的图片格式
         if os.path.isfile(file_path) and filename.lower().endswith(supported_formats):
-            # 判断是否为双页
-            if is_double_page(file_path):
-                split_double_page(file_path, output_dir)
-            else:
-                # 单页图片直接复制到输出目录，保持原文件名
-                try:
-                    dest_path = os.path.join(output_dir, filename)
-                    shutil.copy2(file_path, dest_path)
-                    print(f"复制单页图片: {filename}")
-                except Exception as e:
-                    print(f"复制单页图片 {filename} 时出错: {e}")
+            page_files.append(file_path)
+
+    # 先通过文件头把页面分为单页和双页，此时还没有任何解码
+    page_kinds = [is_double_page(file_path) for file_path in page_files]
+    double_count = sum(page_kinds)
+    print(f"找到 {len(page_files)} 张图片：双页 {double_count} 张，单页 {len(page_files) - double_count} 张")
+
+    start_time = time.perf_counter()
+    if jobs > 1 and len(page_files) > 1:
+        # 输出文件名只由输入文件名决定（_01/_02），与进程调度顺序无关
+        chunksize = max(1, len(page_files) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(process_page, page_files, repeat(output_dir), page_kinds,
+                                        repeat(lossless), repeat(gutter), repeat(min_confidence),
+                                        repeat(ambiguous), chunksize=chunksize))
+    else:
+        results = [process_page(file_path, output_dir, double_page, lossless, gutter, min_confidence, ambiguous)
+                   for file_path, double_page in zip(page_files, page_kinds)]
+    elapsed = time.perf_counter() - start_time
+
+    pages_per_second = len(page_files) / elapsed if elapsed > 0 else 0.0
+    print(f"共处理 {len(page_files)} 张图片，输出 {sum(count for count, _ in results)} 页，"
+          f"耗时 {elapsed:.2f} 秒（{pages_per_second:.1f} 张/秒）")
+
+    # 中缝不明显的双页需要人工确认
+    ambiguous_pages = [(file_path, confidence) for file_path, (_, confidence) in zip(page_files, results)
+                       if confidence is not None]
+    if ambiguous_pages:
+        action = '未拆分' if ambiguous == 'copy' else '已按中间拆分'
+        print(f"⚠️ 以下 {len(ambiguous_pages)} 张双页无法判断中缝（{action}），请人工确认:")
+        for file_path, confidence in ambiguous_pages:
+            print(f"  {os.path.basename(file_path)}（置信度 {confidence:.2f}）")
 
     return output_dir
 
@@ -83,6 +246,16 @@ def main():
     # 设置命令行参数
     parser = argparse.ArgumentParser(description='将漫画双页图片批量拆分为单页（带对应关系的输出文件夹）')
     parser.add_argument('input_dir', help='包含漫画图片的目录路径')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行处理的进程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--lossless', action='store_true',
+                        help='JPEG 双页使用 jpegtran 按 MCU 边界无损拆分（分割点未对齐时回退到重新编码）')
+    parser.add_argument('--gutter', action='store_true',
+                        help='检测双页的中缝，在中缝处拆分，而不是固定按中间拆分')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f'中缝检测的最低置信度 0-1（默认 {DEFAULT_MIN_CONFIDENCE}），低于该值的页面会被报告')
+    parser.add_argument('--ambiguous', choices=AMBIGUOUS_MODES, default='copy',
+                        help='无法判断中缝的双页：copy 原样复制不拆分（默认），center 仍按中间拆分')
 
     # 解析参数
     args = parser.parse_args()
@@ -92,9 +265,15 @@ def main():
         print(f"错误: 目录 '{args.input_dir}' 不存在")
         sys.exit(1)
 
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+
+    if args.lossless and not JPEGTRAN:
+        print("警告: 未找到 jpegtran，无损拆分不可用，将使用重新编码")
+
     # 处理目录
     print(f"开始处理目录: {args.input_dir}")
-    output_dir = process_directory(args.input_dir)
+    output_dir = process_directory(args.input_dir, jobs, args.lossless, args.gutter,
+                                   args.min_confidence, args.ambiguous)
     print(f"处理完成，拆分后的图片保存在: {output_dir}")
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+"""
+文件标签读写：按平台选择存储方式
+- macos: Finder 标签（NSURLTagNamesKey），只在使用时才导入 Foundation
+- xattr: Linux 扩展属性 user.xdg.tags（逗号分隔，与 freedesktop 约定一致）
+- sidecar: 同目录下的 .tags.json，文件系统不支持扩展属性时使用
+"""
+import os
+import sys
+import json
+import errno
+import threading
+
+XDG_TAGS_ATTR = 'user.xdg.tags'
+SIDECAR_NAME = '.tags.json'
+
+# 文件系统不支持扩展属性时的错误码
+XATTR_UNSUPPORTED_ERRNOS = {errno.ENOTSUP, errno.EOPNOTSUPP, errno.EPERM}
+
+class MacOSTagBackend:
+    name = 'macos'
+
+    def __init__(self):
+        # pyobjc 导入很慢，只有确实用到 macOS 标签时才加载
+        from Foundation import NSURL
+        self.NSURL = NSURL
+
+    def get_tags(self, path):
+        url = self.NSURL.fileURLWithPath_(path)
+        values, _ = url.resourceValuesForKeys_error_(['NSURLTagNamesKey'], None)
+        return list(values.get('NSURLTagNamesKey', None) or [])
+
+    def set_tags(self, path, tags):
+        url = self.NSURL.fileURLWithPath_(path)
+        success, _ = url.setResourceValue_forKey_error_(list(tags), 'NSURLTagNamesKey', None)
+        return bool(success)
+
+class SidecarTagBackend:
+    """标签记录在文件所在目录的 .tags.json 中：{文件名: [标签, ...]}"""
+    name = 'sidecar'
+
+    def __init__(self):
+        # 多线程处理时 .tags.json 的读-改-写必须串行
+        self.lock = threading.Lock()
+
+    def _load(self, directory):
+        try:
+            with open(os.path.join(directory, SIDECAR_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, directory, mapping):
+        sidecar_path = os.path.join(directory, SIDECAR_NAME)
+        mapping = {name: tags for name, tags in mapping.items() if tags}
+        if not mapping:
+            if os.path.exists(sidecar_path):
+                os.remove(sidecar_path)
+            return
+        with open(sidecar_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(mapping, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(sidecar_path + '.tmp', sidecar_path)
+
+    def get_tags(self, path):
+        directory, filename = os.path.split(os.path.abspath(path))
+        return list(self._load(directory).get(filename, []))
+
+    def set_tags(self, path, tags):
+        directory, filename = os.path.split(os.path.abspath(path))
+        self.write_directory(directory, {filename: tags})
+        return True
+
+    def read_directory(self, directory, filenames):
+        mapping = self._load(directory)
+        return {filename: list(mapping.get(filename, [])) for filename in filenames}
+
+    def write_directory(self, directory, tags_by_name):
+        with self.lock:
+            mapping = self._load(directory)
+            mapping.update({filename: list(tags) for filename, tags in tags_by_name.items()})
+            self._save(directory, mapping)
+
+class XattrTagBackend:
+    """Linux 扩展属性；文件系统不支持时自动退回到 sidecar"""
+    name = 'xattr'
+
+    def __init__(self):
+        self.fallback = SidecarTagBackend()
+
+    def get_tags(self, path):
+        try:
+            value = os.getxattr(path, XDG_TAGS_ATTR)
+        except OSError as e:
+            if e.errno == errno.ENODATA:
+                return []
+            if e.errno in XATTR_UNSUPPORTED_ERRNOS:
+                return self.fallback.get_tags(path)
+            raise
+        return [tag for tag in value.decode('utf-8').split(',') if tag]
+
+    def set_tags(self, path, tags):
+        try:
+            if tags:
+                os.setxattr(path, XDG_TAGS_ATTR, ','.join(tags).encode('utf-8'))
+            else:
+                try:
+                    os.removexattr(path, XDG_TAGS_ATTR)
+                except OSError as e:
+                    if e.errno != errno.ENODATA:
+                        raise
+        except OSError as e:
+            if e.errno in XATTR_UNSUPPORTED_ERRNOS:
+                return self.fallback.set_tags(path, tags)
+            raise
+        return True
+
+TAG_BACKENDS = {
+    'macos': MacOSTagBackend,
+    'xattr': XattrTagBackend,
+    'sidecar': SidecarTagBackend,
+}
+
+def default_backend_name():
+    if sys.platform == 'darwin':
+        return 'macos'
+    if hasattr(os, 'setxattr'):
+        return 'xattr'
+    return 'sidecar'
+
+_backends = {}
+
+def get_tag_backend(name=None):
+    """按名称获取标签后端（默认按平台选择），同一进程内只创建一次"""
+    name = name or default_backend_name()
+    if name not in _backends:
+        _backends[name] = TAG_BACKENDS[name]()
+    return _backends[name]
+
+def get_tags(path, backend=None):
+    return get_tag_backend(backend).get_tags(path)
+
+def set_tags(path, tags, backend=None):
+    """写入标签，返回是否成功"""
+    return get_tag_backend(backend).set_tags(path, tags)
+
+def read_directory_tags(directory, filenames=None, backend=None):
+    """一次读取目录中多个文件的标签，返回 {文件名: [标签, ...]}"""
+    tag_backend = get_tag_backend(backend)
+    if filenames is None:
+        filenames = [f for f in os.listdir(directory)
+                     if f != SIDECAR_NAME and os.path.isfile(os.path.join(directory, f))]
+    if hasattr(tag_backend, 'read_directory'):
+        return tag_backend.read_directory(directory, filenames)
+    return {filename: tag_backend.get_tags(os.path.join(directory, filename)) for filename in filenames}
+
+def write_directory_tags(directory, tags_by_name, backend=None):
+    """一次写入目录中多个文件的标签，返回写入失败的文件名列表"""
+    tag_backend = get_tag_backend(backend)
+    if hasattr(tag_backend, 'write_directory'):
+        tag_backend.write_directory(directory, tags_by_name)
+        return []
+    return [filename for filename, tags in tags_by_name.items()
+            if not tag_backend.set_tags(os.path.join(directory, filename), tags)]
@@ -0,0 +1,73 @@
+"""
+双页中缝检测：在缩小的灰度图上用 NumPy 计算每一列的亮度/方差，找出真正的装订线位置
+- 中缝附近的列通常内容很少（空白或阴影），列方差明显低于两侧的画面
+- 只在中心附近的窗口内搜索，并对偏离中心的位置加一点惩罚
+- 置信度为中缝得分相对窗口内典型得分的突出程度（0-1），过低说明不像双页或中缝不明显
+"""
+import numpy as np
+from PIL import Image
+
+# 检测用的缩略图宽度（像素）
+ANALYSIS_WIDTH = 320
+
+# 以中心为基准，左右各搜索图片宽度的比例
+SEARCH_RATIO = 0.15
+
+# 平滑列得分的窗口宽度（缩略图像素）
+SMOOTH_WIDTH = 3
+
+# 偏离中心的惩罚权重
+CENTER_PENALTY = 0.15
+
+def load_analysis_image(image_path):
+    """以灰度读取缩小后的图片；JPEG 通过 draft 在解码时直接缩小，返回 (数组, 原始宽度)"""
+    with Image.open(image_path) as img:
+        width, height = img.size
+        target_height = max(1, round(height * ANALYSIS_WIDTH / width))
+        img.draft('L', (ANALYSIS_WIDTH, target_height))
+        gray = img.convert('L')
+        if gray.width > ANALYSIS_WIDTH:
+            gray = gray.resize((ANALYSIS_WIDTH, target_height), Image.Resampling.BOX)
+        return np.asarray(gray, dtype=np.float32) / 255.0, width
+
+def column_scores(pixels):
+    """每一列的中缝得分，越低越像中缝：列标准差 + 与相邻列的平均差异"""
+    column_std = pixels.std(axis=0)
+    # 内容在中缝处断开，相邻列差异小；画面连续跨过中缝时差异大
+    column_diff = np.abs(np.diff(pixels, axis=1)).mean(axis=0)
+    column_diff = np.concatenate((column_diff[:1], column_diff))
+    scores = column_std + column_diff
+    if SMOOTH_WIDTH > 1 and scores.size >= SMOOTH_WIDTH:
+        scores = np.convolve(scores, np.ones(SMOOTH_WIDTH) / SMOOTH_WIDTH, mode='same')
+    return scores
+
+def find_gutter(image_path):
+    """返回 (原图中的中缝 x 坐标, 置信度 0-1)"""
+    pixels, original_width = load_analysis_image(image_path)
+    width = pixels.shape[1]
+    center = width / 2
+    radius = max(1, int(width * SEARCH_RATIO))
+    start, end = max(1, int(center - radius)), min(width - 1, int(center + radius) + 1)
+
+    scores = column_scores(pixels)[start:end]
+    positions = np.arange(start, end)
+    # 分数归一化到窗口内的典型值，再加上离中心越远越大的惩罚
+    typical = float(np.median(scores))
+    penalty = CENTER_PENALTY * np.abs(positions - center) / radius * max(typical, 1e-3)
+    index = int(np.argmin(scores + penalty))
+
+    # 中缝是一段宽度不定的空白时，取 argmin 所在的低分连续区间的中点
+    best = float(scores[index])
+    threshold = best + 0.1 * (typical - best)
+    left = right = index
+    while left > 0 and scores[left - 1] <= threshold:
+        left -= 1
+    while right < len(scores) - 1 and scores[right + 1] <= threshold:
+        right += 1
+    gutter_x = (positions[left] + positions[right]) / 2
+
+    confidence = (typical - best) / typical if typical > 1e-6 else 0.0
+    confidence = max(0.0, min(1.0, confidence))
+
+    split_x = round((gutter_x + 0.5) * original_width / width)
+    return split_x, confidence
@@ -2,67 +2,130 @@ import os
 import sys
 import zipfile
 import shutil
-from Foundation import NSURL
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from file_tags import read_directory_tags, set_tags
+from zip_stream import COPY_BUFFER_SIZE, can_copy_raw, copy_member_raw
 
-def get_zip_tag(zip_path):
-    url = NSURL.fileURLWithPath_(zip_path)
-    values, _ = url.resourceValuesForKeys_error_(['NSURLTagNamesKey'], None)
-    tags = values.get('NSURLTagNamesKey', [])
-    return tags
+def top_level_folder(infos):
+    """所有成员都在同一个顶层文件夹中时返回该文件夹名，否则返回 None"""
+    folder = None
+    for info in infos:
+        head, sep, _ = info.filename.partition('/')
+        if not sep:
+            return None
+        if folder is None:
+            folder = head
+        elif head != folder:
+            return None
+    return folder
 
-def set_zip_tag(zip_path, tags):
-    url = NSURL.fileURLWithPath_(zip_path)
-    error = None
-    success = url.setResourceValue_forKey_error_(tags, 'NSURLTagNamesKey', error)
-    if not success:
-        print(f"标签写入失败: {zip_path}")
+def folder_to_rename(infos, new_folder):
+    """需要重命名的顶层文件夹名；没有唯一顶层文件夹或已经一致时返回 None"""
+    old_folder = top_level_folder(infos)
+    if old_folder is None or old_folder == new_folder:
+        return None
+    return old_folder
 
-def main():
-    if len(sys.argv) != 2:
-        print('用法: python zip_rename_inside.py <文件夹路径>')
-        sys.exit(1)
-    folder = sys.argv[1]
-    for filename in os.listdir(folder):
-        if filename.lower().endswith('.zip'):
-            zip_path = os.path.join(folder, filename)
-            tags = get_zip_tag(zip_path)
-            print(f"{filename} 标签: {', '.join(tags)}")
+def inspect_archive(zip_path, new_folder):
+    """只读取中央目录，判断压缩包是否需要修改，返回原文件夹名或 None"""
+    with zipfile.ZipFile(zip_path, 'r') as source:
+        return folder_to_rename(source.infolist(), new_folder)
+
+def rename_inside(zip_path, new_folder):
+    """把压缩包内唯一的顶层文件夹重命名为 new_folder
+
+    逐个成员原样复制压缩数据到新压缩包，不解压、不产生临时目录，完成后原子替换原文件
+    返回原文件夹名；不需要修改时返回 None
+    """
+    with zipfile.ZipFile(zip_path, 'r') as source:
+        infos = source.infolist()
+        old_folder = folder_to_rename(infos, new_folder)
+        if old_folder is None:
+            return None
 
-            zip_name = os.path.splitext(filename)[0]
-            extract_dir = os.path.join(folder, zip_name + '_tmp')
+        tmp_path = zip_path + '.tmp'
+        try:
+            with zipfile.ZipFile(tmp_path, 'w') as target, open(zip_path, 'rb') as raw_src:
+                target.comment = source.comment
+                for info in infos:
+                    arcname = new_folder + info.filename[len(old_folder):]
+                    if can_copy_raw(info):
+                        copy_member_raw(raw_src, info, target, arcname)
+                    else:
+                        # 加密或不常见的压缩方式，只能解压后重新写入
+                        zinfo = zipfile.ZipInfo(arcname, date_time=info.date_time)
+                        zinfo.compress_type = zipfile.ZIP_DEFLATED
+                        zinfo.external_attr = info.external_attr
+                        with source.open(info) as src, target.open(zinfo, 'w') as dst:
+                            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
 
-            # 解压
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
+    os.replace(tmp_path, zip_path)
+    return old_folder
 
-            # 检查解压出来的文件夹名
-            extracted_items = os.listdir(extract_dir)
-            # 只考虑解压出来只有一个文件夹的情况
-            if len(extracted_items) == 1 and os.path.isdir(os.path.join(extract_dir, extracted_items[0])):
-                inner_folder = extracted_items[0]
-                inner_folder_path = os.path.join(extract_dir, inner_folder)
-                if inner_folder != zip_name:
-                    # 重命名为和zip文件名一致
-                    new_inner_folder_path = os.path.join(extract_dir, zip_name)
-                    os.rename(inner_folder_path, new_inner_folder_path)
-                    print(f"已重命名文件夹: {inner_folder} -> {zip_name}")
-                else:
-                    new_inner_folder_path = inner_folder_path
+def process_archive(zip_path, tags, dry_run=False):
+    """处理单个压缩包，返回要打印的日志（多线程时由主线程按顺序打印）"""
+    filename = os.path.basename(zip_path)
+    zip_name = os.path.splitext(filename)[0]
+    lines = [f"{filename} 标签: {', '.join(tags)}"]
+    try:
+        if dry_run:
+            inner_folder = inspect_archive(zip_path, zip_name)
+            if inner_folder is None:
+                lines.append(f'无需修改: {zip_path}')
             else:
-                # 如果不是只有一个文件夹，直接用解压目录
-                new_inner_folder_path = extract_dir
+                lines.append(f'将重命名文件夹: {inner_folder} -> {zip_name}')
+            return lines
 
-            # 重新压缩为原文件名
-            new_zip_path = os.path.join(folder, filename)
-            shutil.make_archive(os.path.splitext(new_zip_path)[0], 'zip', new_inner_folder_path)
+        # 只考虑压缩包内只有一个文件夹的情况，文件夹名与zip文件名一致时无需改动
+        inner_folder = rename_inside(zip_path, zip_name)
+        if inner_folder is None:
+            lines.append(f'无需修改: {zip_path}')
+            return lines
+        lines.append(f"已重命名文件夹: {inner_folder} -> {zip_name}")
 
-            # 给新压缩包写入标签
-            set_zip_tag(new_zip_path, tags)
+        # 替换后是新文件，重新写入标签
+        if set_tags(zip_path, tags):
+            lines.append(f'已生成新压缩包并写入标签: {zip_path}')
+        else:
+            lines.append(f"标签写入失败: {zip_path}")
+    except Exception as e:
+        lines.append(f'❌ 处理失败: {zip_path}，错误: {e}')
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description='把压缩包内的顶层文件夹重命名为压缩包文件名（保留文件标签）')
+    parser.add_argument('folder', help='压缩包所在文件夹路径')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行处理的压缩包数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--dry-run', action='store_true', help='只读取中央目录，列出需要修改的压缩包，不写入任何文件')
+    args = parser.parse_args()
+
+    folder = args.folder
+    if not os.path.isdir(folder):
+        print(f"错误: 目录 '{folder}' 不存在")
+        sys.exit(1)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
 
-            # 清理临时文件夹
-            shutil.rmtree(extract_dir)
+    zip_files = sorted(filename for filename in os.listdir(folder) if filename.lower().endswith('.zip'))
+    # 一次读出所有压缩包的标签
+    tags_by_name = read_directory_tags(folder, zip_files)
+    zip_paths = [os.path.join(folder, filename) for filename in zip_files]
+    tags_list = [tags_by_name[filename] for filename in zip_files]
 
-            print(f'已生成新压缩包并写入标签: {new_zip_path}')
+    # 原样复制压缩数据主要是磁盘 I/O，用线程即可；map 按提交顺序返回，日志顺序与单线程一致
+    if jobs > 1 and len(zip_files) > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for lines in executor.map(process_archive, zip_paths, tags_list, repeat(args.dry_run)):
+                print('\n'.join(lines))
+    else:
+        for lines in map(process_archive, zip_paths, tags_list, repeat(args.dry_run)):
+            print('\n'.join(lines))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,137 @@
+"""
+图片尺寸探测：只读取文件头获取宽高，不解码像素
+支持 JPEG (SOF)、PNG (IHDR)、WebP (VP8X / VP8 / VP8L)，其他格式回退到 Pillow 的延迟打开
+结果按文件路径 + 修改时间缓存，同一文件重复探测不会再次读盘
+"""
+import os
+import struct
+
+# 缓存: 路径 -> ((mtime_ns, size), (width, height))
+_size_cache = {}
+
+# JPEG 中携带图像尺寸的 SOF 标记（排除 DHT/JPG/DAC）
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# 没有长度字段的独立标记：TEM、RST0-7、SOI、EOI
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xDA)}
+
+def read_jpeg_sof(f):
+    """读取 JPEG 的 SOF 段，返回 (width, height, components)；components 为 [(id, h采样, v采样), ...]"""
+    if f.read(2) != b'\xff\xd8':
+        return None
+
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+
+        # 跳过填充的 0xFF
+        marker = f.read(1)
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+
+        if marker in JPEG_STANDALONE_MARKERS or marker == 0x00:
+            continue
+        if marker == 0xDA:
+            # 已到扫描数据，仍未找到 SOF
+            return None
+
+        length_bytes = f.read(2)
+        if len(length_bytes) != 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+
+        if marker in JPEG_SOF_MARKERS:
+            segment = f.read(length - 2)
+            if len(segment) < 6:
+                return None
+            height, width, count = struct.unpack('>HHB', segment[1:6])
+            components = []
+            for i in range(count):
+                offset = 6 + i * 3
+                if offset + 2 >= len(segment):
+                    break
+                sampling = segment[offset + 1]
+                components.append((segment[offset], sampling >> 4, sampling & 0x0F))
+            return width, height, components
+
+        f.seek(length - 2, os.SEEK_CUR)
+
+def _read_png_size(header):
+    if header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+def _read_webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8X':
+        width = 1 + int.from_bytes(header[24:27], 'little')
+        height = 1 + int.from_bytes(header[27:30], 'little')
+        return width, height
+    if chunk == b'VP8 ':
+        # 关键帧起始码 9d 01 2a 之后是 14 位宽高
+        if header[23:26] != b'\x9d\x01\x2a':
+            return None
+        width, height = struct.unpack('<HH', header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        if header[20] != 0x2F:
+            return None
+        bits = int.from_bytes(header[21:25], 'little')
+        return 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+    return None
+
+def is_lossless_webp(image_path):
+    """WebP 的图像数据块是 VP8L（无损）时返回 True；遍历 RIFF 块，跳过 VP8X/ICCP/ALPH 等"""
+    with open(image_path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+            return False
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return False
+            chunk_type = chunk[:4]
+            if chunk_type in (b'VP8L', b'VP8 ', b'ANMF'):
+                return chunk_type == b'VP8L'
+            # 块长度为奇数时有一个填充字节
+            chunk_size = struct.unpack('<I', chunk[4:8])[0]
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+def _read_image_size(f):
+    header = f.read(32)
+    if header.startswith(b'\xff\xd8'):
+        f.seek(0)
+        sof = read_jpeg_sof(f)
+        return sof[:2] if sof else None
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return _read_png_size(header)
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP' and len(header) >= 30:
+        return _read_webp_size(header)
+    return None
+
+def probe_image_size(image_path):
+    """只读取文件头获取图片 (width, height)，按路径和修改时间缓存"""
+    stat = os.stat(image_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _size_cache.get(image_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(image_path, 'rb') as f:
+        size = _read_image_size(f)
+
+    if size is None:
+        # 未识别的格式（GIF/BMP/TIFF 等）交给 Pillow，Image.open 同样只解析文件头
+        from PIL import Image
+        with Image.open(image_path) as img:
+            size = img.size
+
+    _size_cache[image_path] = (key, size)
+    return size
@@ -0,0 +1,345 @@
+"""
+漫画页面流水线：压缩包/文件夹 → 若干处理步骤 → CBZ/zip
+替代 unzip_all.sh → convert-image-format-to → double-page-crop → chapter_pages_rename_by_order.sh → zip_all.sh
+每一页只读取一次、最多解码一次、最后编码并写入一次，中间不产生任何目录
+页面由各个进程按需读取，同时在处理或等待写入的页面最多为进程数的 2 倍，处理结果按顺序直接写入压缩包
+rename 的位数按输入页数预估并直接写入正式文件名；只有拆分后总页数跨过 10 的幂、位数变化时，才原样复制一遍改名
+
+可用步骤：
+- convert: 转换为指定格式并去除元数据（与 convert-image-format-to 的 Pillow 后端相同）
+- split: 宽度大于高度的双页拆分为两页，右页在前（直接使用 double-page-crop 的拆分逻辑，支持 --gutter / --lossless）
+- rename: 按顺序重命名为 00、01、02…（与 chapter_pages_rename_by_order.sh 相同）
+- pack: 写出压缩包（总是最后执行，可省略）
+步骤顺序必须是 convert/split → rename → pack，不符合时直接报错，不会悄悄调整顺序
+"""
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+import argparse
+import posixpath
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from PIL import Image
+from convert_image_format_to import encoder_settings, pillow_save_options, strip_metadata, prepare_mode
+from zip_stream import copy_member_raw
+from double_page_crop import (JPEGTRAN, DEFAULT_MIN_CONFIDENCE, AMBIGUOUS_MODES,
+                              decide_split, split_jpeg_bytes_lossless)
+
+STAGES = ('convert', 'split', 'rename', 'pack')
+
+# 步骤的先后层级：convert/split 逐页处理（两者之间按给定顺序执行），rename 作用于整本书的页序，pack 最后写出
+STAGE_RANKS = {'convert': 0, 'split': 0, 'rename': 1, 'pack': 2}
+
+# 支持的图片格式
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.avif')
+
+def natural_sort_key(filename):
+    """与 sort -V 类似：数字部分按数值比较"""
+    return [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', filename)]
+
+class Page:
+    """流水线中的一页：未修改时只持有原始字节，需要处理时才解码，最后只编码一次"""
+
+    def __init__(self, name, data):
+        self.name, ext = os.path.splitext(name)
+        self.ext = ext.lower().lstrip('.')
+        self.data = data
+        self.image = None
+        self.settings = None
+
+    def size(self):
+        if self.image is not None:
+            return self.image.size
+        # Image.open 只解析文件头，不解码像素
+        with Image.open(io.BytesIO(self.data)) as img:
+            return img.size
+
+    def decode(self):
+        if self.image is None:
+            self.image = Image.open(io.BytesIO(self.data))
+            self.image.load()
+        return self.image
+
+    def derive(self, name, image):
+        """由当前页生成的新页（拆分出的左右页），沿用格式和编码参数"""
+        page = Page(f"{name}.{self.ext}", None)
+        page.image = image
+        page.settings = self.settings
+        return page
+
+    def encode(self):
+        """返回最终写入压缩包的字节；没有解码过的页直接使用原始字节"""
+        if self.image is None:
+            return self.data
+        settings = self.settings if self.settings is not None else encoder_settings(self.ext)
+        buffer = io.BytesIO()
+        image_format = Image.registered_extensions()[f".{self.ext}"]
+        self.image.save(buffer, format=image_format, **pillow_save_options(self.ext, settings))
+        return buffer.getvalue()
+
+def convert_page(page, out_format, settings):
+    image = page.decode()
+    page.image = prepare_mode(strip_metadata(image), out_format)
+    page.ext = out_format
+    page.settings = settings
+    return [page]
+
+def split_page(page, lossless=False, gutter=False, min_confidence=DEFAULT_MIN_CONFIDENCE, ambiguous='copy'):
+    """双页拆分为两页，右页（_01）在前；单页原样返回，不解码
+
+    是否拆分、在哪里拆分由 double_page_crop.decide_split 决定；lossless 为 True 时，
+    尚未解码的 JPEG 用 jpegtran 在内存中无损拆分，分割点无法对齐 MCU 或 jpegtran 失败时回退到重新编码
+    """
+    width, height = page.size()
+    if width <= height:
+        return [page]
+    filename = f"{page.name}.{page.ext}"
+    split, split_pos, _ = decide_split(io.BytesIO(page.data), filename, gutter, min_confidence, ambiguous)
+    if not split:
+        return [page]
+
+    if lossless and JPEGTRAN and page.image is None and page.ext in ('jpg', 'jpeg'):
+        try:
+            halves = split_jpeg_bytes_lossless(page.data, split_pos)
+            if halves is not None:
+                right_data, left_data = halves
+                return [Page(f"{page.name}_01.{page.ext}", right_data), Page(f"{page.name}_02.{page.ext}", left_data)]
+            print(f"分割点未对齐 MCU，回退到重新编码: {filename}")
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"jpegtran 无损拆分失败（{e}），回退到重新编码: {filename}")
+
+    image = page.decode()
+    if split_pos is None:
+        split_pos = width // 2
+    right_page = page.derive(f"{page.name}_01", image.crop((split_pos, 0, width, height)))
+    left_page = page.derive(f"{page.name}_02", image.crop((0, 0, split_pos, height)))
+    return [right_page, left_page]
+
+def run_page_stages(name, data, stages, out_format=None, settings=None, split_options=None):
+    """让一页依次经过 convert / split，返回 [(文件名, 字节), ...]
+
+    split_options 为传给 split_page 的参数（lossless / gutter / min_confidence / ambiguous）
+    """
+    pages = [Page(name, data)]
+    for stage in stages:
+        if stage == 'convert':
+            pages = [result for page in pages for result in convert_page(page, out_format, settings)]
+        elif stage == 'split':
+            pages = [result for page in pages for result in split_page(page, **(split_options or {}))]
+    return [(f"{page.name}.{page.ext}", page.encode()) for page in pages]
+
+# 每个进程中打开过的源压缩包，同一本书的页面复用同一个 ZipFile
+_open_archives = {}
+
+def load_page(input_path, source_name):
+    """按需读取一页的原始字节：文件夹中的文件，或压缩包中的成员"""
+    if os.path.isdir(input_path):
+        with open(os.path.join(input_path, source_name), 'rb') as f:
+            return f.read()
+    if input_path not in _open_archives:
+        _open_archives[input_path] = zipfile.ZipFile(input_path, 'r')
+    return _open_archives[input_path].read(source_name)
+
+def run_page_stages_safe(input_path, name, source_name, stages, out_format=None, settings=None,
+                         split_options=None):
+    """读取一页并处理，出错时保留原页，返回 (结果, 错误)"""
+    data = None
+    try:
+        data = load_page(input_path, source_name)
+        return run_page_stages(name, data, stages, out_format, settings, split_options), None
+    except Exception as e:
+        return ([(name, data)] if data is not None else []), str(e)
+
+def list_pages(input_path):
+    """列出文件夹或压缩包中的图片，按自然排序返回 [(输出文件名, 源文件名或成员名), ...]
+
+    压缩包保留子目录结构（去掉所有页面共同的上级目录），不同目录中的同名页面不会互相覆盖
+    """
+    if os.path.isdir(input_path):
+        pages = [(filename, filename) for filename in os.listdir(input_path)
+                 if not filename.startswith('.') and filename.lower().endswith(IMAGE_EXTS)
+                 and os.path.isfile(os.path.join(input_path, filename))]
+    else:
+        # 与 unzip_all.sh 一样忽略 __MACOSX 和隐藏文件
+        with zipfile.ZipFile(input_path, 'r') as source:
+            members = [info.filename for info in source.infolist()
+                       if not (info.is_dir() or info.filename.startswith('__MACOSX')
+                               or posixpath.basename(info.filename).startswith('.')
+                               or not info.filename.lower().endswith(IMAGE_EXTS))]
+        common = posixpath.commonpath([posixpath.dirname(member) for member in members]) if members else ''
+        pages = [(posixpath.relpath(member, common) if common else member, member) for member in members]
+    pages.sort(key=lambda page: natural_sort_key(page[0]))
+    return pages
+
+def page_digits(count):
+    """rename 的位数：总页数的位数，至少两位"""
+    return max(2, len(str(count)))
+
+def rename_page(index, name, digits):
+    return f"{index:0{digits}d}{os.path.splitext(name)[1]}"
+
+def rename_pages(names):
+    """按顺序重命名为 00、01…，位数取总页数的位数且至少两位"""
+    digits = page_digits(len(names))
+    return [rename_page(index, name, digits) for index, name in enumerate(names)]
+
+def pack_pages(page_results, output_path, rename=False, expected_count=0):
+    """按顺序逐页写出压缩包，返回写入的页数
+
+    .cbz 页面放在根目录，.zip 与 zip_all.sh 一样放在同名文件夹中；图片已压缩，不再 deflate
+    rename 时按 expected_count 预估位数直接写入正式文件名；实际页数的位数不同时，最后原样复制压缩数据改名
+    """
+    folder = '' if output_path.lower().endswith('.cbz') else os.path.splitext(os.path.basename(output_path))[0] + '/'
+    tmp_path = output_path + '.tmp'
+    digits = page_digits(expected_count)
+    names = []
+    written = set()
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as target:
+            for pages in page_results:
+                for name, data in pages:
+                    if rename:
+                        arcname = rename_page(len(names), name, digits)
+                    elif name in written:
+                        raise ValueError(f"输出文件名冲突: {name}")
+                    else:
+                        arcname = name
+                    written.add(name)
+                    names.append(name)
+                    target.writestr(folder + arcname, data)
+
+        if rename and page_digits(len(names)) != digits:
+            renamed_path = output_path + '.rename.tmp'
+            with zipfile.ZipFile(tmp_path, 'r') as source, open(tmp_path, 'rb') as raw_src, \
+                    zipfile.ZipFile(renamed_path, 'w', zipfile.ZIP_STORED) as target:
+                for info, new_name in zip(source.infolist(), rename_pages(names)):
+                    copy_member_raw(raw_src, info, target, folder + new_name)
+            os.replace(renamed_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        for path in (tmp_path, output_path + '.rename.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+    return len(names)
+
+def map_in_order(executor, function, window, *iterables):
+    """与 executor.map 一样按提交顺序返回结果，但最多只提交 window 个尚未取走的任务
+
+    executor.map 会一次提交所有页面，写入跟不上时处理完的页面会堆在主进程内存中
+    """
+    pending = deque()
+    for arguments in zip(*iterables):
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, *arguments))
+    while pending:
+        yield pending.popleft().result()
+
+def run_pipeline(input_path, output_path, stages, out_format=None, quality=None, effort=None, jobs=1,
+                 split_options=None):
+    """执行流水线，返回写入的页数"""
+    pages = list_pages(input_path)
+    print(f"找到 {len(pages)} 张图片: {input_path}")
+
+    settings = encoder_settings(out_format, quality, effort) if out_format else None
+    page_stages = [stage for stage in stages if stage in ('convert', 'split')]
+    names = [name for name, _ in pages]
+    source_names = [source_name for _, source_name in pages]
+
+    def report(results):
+        # 结果按页序产生，边处理边写入压缩包
+        for name, (page_results, error) in zip(names, results):
+            if error:
+                print(f"❌ 处理失败，保留原页: {name}，错误: {error}")
+            yield page_results
+
+    start_time = time.perf_counter()
+    rename = 'rename' in stages
+    if jobs > 1 and len(pages) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = map_in_order(executor, run_page_stages_safe, jobs * 2, repeat(input_path), names,
+                                   source_names, repeat(page_stages), repeat(out_format), repeat(settings),
+                                   repeat(split_options))
+            output_count = pack_pages(report(results), output_path, rename, len(pages))
+    else:
+        results = (run_page_stages_safe(input_path, name, source_name, page_stages, out_format, settings,
+                                        split_options)
+                   for name, source_name in pages)
+        output_count = pack_pages(report(results), output_path, rename, len(pages))
+
+    elapsed = time.perf_counter() - start_time
+    pages_per_second = len(pages) / elapsed if elapsed > 0 else 0.0
+    print(f"共处理 {len(pages)} 张图片，输出 {output_count} 页，"
+          f"耗时 {elapsed:.2f} 秒（{pages_per_second:.1f} 张/秒）")
+    return output_count
+
+def parse_stages(value):
+    stages = [stage.strip() for stage in value.split(',') if stage.strip()]
+    for stage in stages:
+        if stage not in STAGES:
+            raise argparse.ArgumentTypeError(f"未知步骤: {stage}（可用: {', '.join(STAGES)}）")
+    if len(set(stages)) != len(stages):
+        raise argparse.ArgumentTypeError(f"步骤不能重复: {value}")
+    if any(STAGE_RANKS[a] > STAGE_RANKS[b] for a, b in zip(stages, stages[1:])):
+        raise argparse.ArgumentTypeError(f"步骤顺序必须是 convert/split → rename → pack: {value}")
+    return stages
+
+def main():
+    parser = argparse.ArgumentParser(description='漫画页面流水线：读取文件夹或压缩包，在内存中依次处理后写出 CBZ/zip')
+    parser.add_argument('input_path', help='图片文件夹或 zip/cbz 压缩包路径')
+    parser.add_argument('-s', '--stages', type=parse_stages, default=['split', 'rename', 'pack'],
+                        help='逗号分隔的处理步骤：convert,split,rename,pack（默认 split,rename,pack）')
+    parser.add_argument('-o', '--output', help='输出压缩包路径（.cbz 或 .zip，默认与输入同名的 .cbz）')
+    parser.add_argument('--format', dest='out_format', help='convert 步骤的输出格式，如 jpg / webp / avif / png')
+    parser.add_argument('--quality', type=int, help='convert 步骤的输出画质（默认按格式选择）')
+    parser.add_argument('--effort', type=int, help='convert 步骤的压缩力度（webp 0-6，avif 0-10，png 0-9）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='并行处理的进程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--lossless', action='store_true',
+                        help='split 步骤中未转换的 JPEG 使用 jpegtran 按 MCU 边界无损拆分（与 double-page-crop 相同）')
+    parser.add_argument('--gutter', action='store_true',
+                        help='split 步骤检测双页的中缝，在中缝处拆分，而不是固定按中间拆分')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f'中缝检测的最低置信度 0-1（默认 {DEFAULT_MIN_CONFIDENCE}）')
+    parser.add_argument('--ambiguous', choices=AMBIGUOUS_MODES, default='copy',
+                        help='无法判断中缝的双页：copy 原样保留不拆分（默认），center 仍按中间拆分')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_path):
+        print(f"错误: '{args.input_path}' 不存在")
+        sys.exit(1)
+    if 'convert' in args.stages and not args.out_format:
+        print("错误: convert 步骤需要通过 --format 指定输出格式")
+        sys.exit(1)
+
+    input_path = os.path.abspath(args.input_path)
+    if args.output:
+        output_path = args.output
+    else:
+        base = input_path if os.path.isdir(input_path) else os.path.splitext(input_path)[0]
+        output_path = f"{base}.cbz"
+        if output_path == input_path:
+            output_path = f"{base}_processed.cbz"
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    out_format = args.out_format.lower() if args.out_format else None
+    split_options = {'lossless': args.lossless, 'gutter': args.gutter,
+                     'min_confidence': args.min_confidence, 'ambiguous': args.ambiguous}
+    if args.lossless and not JPEGTRAN:
+        print("警告: 未找到 jpegtran，无损拆分不可用，将使用重新编码")
+
+    try:
+        run_pipeline(input_path, output_path, args.stages, out_format, args.quality, args.effort, jobs,
+                     split_options)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    print(f"处理完成: {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,62 @@
 """
 图片裁剪与拼接脚本
 用法: script.py -u|-d|-l|-r <number> <image1_path> <image2_path>
+      script.py --plan <plan.csv|plan.json> [-j N] [--cache-mb N]
 选项:
   -u, --up      向上裁剪拼接
   -d, --down    向下裁剪拼接
   -l, --left    向左裁剪拼接
   -r, --right   向右裁剪拼接
+  --plan        批量模式：按计划文件一次处理多组图片（不能与方向和图片参数同时使用）
+  -j, --jobs    批量模式的并行线程数
+  --cache-mb    批量模式解码图片缓存的内存上限（MB）
 参数:
   number: 裁剪尺寸（像素）
   image1_path: 第一张图片路径
   image2_path: 第二张图片路径
+计划文件:
+  CSV 表头为 direction,offset,img1,img2（可选 output 列），JSON 为同样字段的对象数组
+  相对路径相对于计划文件所在目录；未指定 output 时结果为 img1 旁的 result_<方向>_<尺寸>_<img1文件名>
 示例: script.py -u 300 image1.jpg image2.jpg
+      script.py --plan fixes.csv -j 4
 """
 
 import sys
 import argparse
+import csv
+import json
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 from PIL import Image
 
+DIRECTIONS = ('up', 'down', 'left', 'right')
+
+# 批量模式默认的解码图片缓存上限
+DEFAULT_CACHE_MB = 1024
+
 def parse_args():
     """解析命令行参数"""
     parser = argparse.ArgumentParser(description='图片裁剪与拼接工具', add_help=False)
 
-    # 方向参数（互斥组）
-    group = parser.add_mutually_exclusive_group(required=True)
+    # 方向参数（互斥组），批量模式下由计划文件指定
+    group = parser.add_mutually_exclusive_group()
     group.add_argument('-u', '--up', action='store_true', help='向上裁剪拼接')
     group.add_argument('-d', '--down', action='store_true', help='向下裁剪拼接')
     group.add_argument('-l', '--left', action='store_true', help='向左裁剪拼接')
     group.add_argument('-r', '--right', action='store_true', help='向右裁剪拼接')
 
     # 其他参数
-    parser.add_argument('number', type=int, help='裁剪尺寸（像素）')
-    parser.add_argument('image1_path', help='第一张图片路径')
-    parser.add_argument('image2_path', help='第二张图片路径')
+    parser.add_argument('number', type=int, nargs='?', help='裁剪尺寸（像素）')
+    parser.add_argument('image1_path', nargs='?', help='第一张图片路径')
+    parser.add_argument('image2_path', nargs='?', help='第二张图片路径')
+    parser.add_argument('--plan', help='批量模式的计划文件（CSV 或 JSON）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='批量模式并行处理的线程数（默认1，0表示使用全部CPU核心）')
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_MB,
+                        help=f'批量模式解码图片缓存的内存上限（默认 {DEFAULT_CACHE_MB} MB）')
     parser.add_argument('-h', '--help', action='help', help='显示帮助信息')
 
     try:
@@ -42,6 +66,15 @@ def parse_args():
         print(__doc__)
         sys.exit(1)
 
+    if args.plan:
+        # 批量模式的方向和图片都来自计划文件，同时给出的参数会被忽略，直接报错
+        if args.up or args.down or args.left or args.right or args.number is not None or args.image1_path:
+            parser.error("--plan 不能与方向参数或 <number> <image1_path> <image2_path> 同时使用")
+        return args
+
+    if args.number is None or not args.image2_path:
+        parser.error("缺少参数：需要 <number> <image1_path> <image2_path>，或使用 --plan")
+
     # 确定方向
     if args.up:
         direction = 'up'
@@ -54,14 +87,18 @@ def parse_args():
     else:
         raise ValueError("必须指定一个方向参数")
 
-    return direction, args.number, args.image1_path, args.image2_path
+    args.direction = direction
+    return args
 
 def process_images(direction, number, img1_path, img2_path):
     """处理图片裁剪与拼接"""
     # 打开图片
     img1 = Image.open(img1_path)
     img2 = Image.open(img2_path)
+    return blend_images(direction, number, img1, img2)
 
+def blend_images(direction, number, img1, img2):
+    """对已打开的两张图片进行裁剪与拼接，不修改输入图片"""
     # 获取图片尺寸
     width1, height1 = img1.size
     width2, height2 = img2.size
@@ -121,25 +158,164 @@ def process_images(direction, number, img1_path, img2_path):
 
     return result
 
+class DecodedImageCache:
+    """按解码后的内存大小限制的 LRU 缓存：多组图片共用的页面只解码一次
+
+    多个线程同时请求同一张图片时，只有一个线程解码，其余线程等待结果
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.images = OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.decodes = 0
+        self.hits = 0
+
+    @staticmethod
+    def image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            if path in self.images:
+                self.images.move_to_end(path)
+                self.hits += 1
+                return self.images[path]
+            event = self.loading.get(path)
+            if event is None:
+                event = self.loading[path] = threading.Event()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            event.wait()
+            with self.lock:
+                if path in self.images:
+                    self.hits += 1
+                    return self.images[path]
+            # 解码失败或已被淘汰，自己重新读取（不放入缓存）
+            return self._decode(path)
+
+        try:
+            img = self._decode(path)
+        except BaseException:
+            with self.lock:
+                del self.loading[path]
+            event.set()
+            raise
+
+        with self.lock:
+            self.decodes += 1
+            size = self.image_bytes(img)
+            # 单张超过上限的图片不缓存
+            if size <= self.max_bytes:
+                self.images[path] = img
+                self.current_bytes += size
+                while self.current_bytes > self.max_bytes:
+                    _, evicted = self.images.popitem(last=False)
+                    self.current_bytes -= self.image_bytes(evicted)
+            del self.loading[path]
+        event.set()
+        return img
+
+    @staticmethod
+    def _decode(path):
+        img = Image.open(path)
+        # load() 读取完单帧图片后会关闭文件
+        img.load()
+        return img
+
+def load_plan(plan_path):
+    """读取计划文件，返回 [{'direction', 'offset', 'img1', 'img2', 'output'}, ...]"""
+    base_dir = os.path.dirname(os.path.abspath(plan_path))
+    with open(plan_path, 'r', encoding='utf-8-sig') as f:
+        if plan_path.lower().endswith('.json'):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    plan = []
+    for line_number, row in enumerate(rows, start=1):
+        try:
+            direction = str(row['direction']).strip().lower()
+            if direction not in DIRECTIONS:
+                raise ValueError(f"未知方向: {direction}")
+            img1 = os.path.join(base_dir, str(row['img1']).strip())
+            output = row.get('output')
+            if output:
+                output = os.path.join(base_dir, str(output).strip())
+            plan.append({
+                'direction': direction,
+                'offset': int(row['offset']),
+                'img1': img1,
+                'img2': os.path.join(base_dir, str(row['img2']).strip()),
+                'output': output,
+            })
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"计划文件第 {line_number} 项无效: {e}") from e
+    return plan
+
+def default_output_path(direction, number, img1_path, unique=False):
+    """结果放在第一张图片旁边（保留其扩展名）；批量模式下加上图片文件名以免互相覆盖"""
+    output_dir = os.path.dirname(img1_path) or os.getcwd()
+    stem, ext = os.path.splitext(os.path.basename(img1_path))
+    if unique:
+        return os.path.join(output_dir, f"result_{direction}_{number}_{stem}{ext}")
+    return os.path.join(output_dir, f"result_{direction}_{number}{ext}")
+
+def run_plan_item(item, cache):
+    """处理计划中的一组图片，返回 (输出路径, 错误)"""
+    output_path = item['output'] or default_output_path(item['direction'], item['offset'], item['img1'], unique=True)
+    try:
+        result_image = blend_images(item['direction'], item['offset'], cache.get(item['img1']), cache.get(item['img2']))
+        result_image.save(output_path)
+        return output_path, None
+    except Exception as e:
+        return output_path, str(e)
+
+def run_plan(plan_path, jobs=1, cache_mb=DEFAULT_CACHE_MB):
+    """按计划文件批量处理，返回失败的组数"""
+    plan = load_plan(plan_path)
+    cache = DecodedImageCache(cache_mb * 1024 * 1024)
+    print(f"读取计划: {plan_path}，共 {len(plan)} 组图片")
+
+    if jobs > 1 and len(plan) > 1:
+        # 解码、裁剪、编码大部分时间在 Pillow 的 C 代码中，线程即可并行；map 按计划顺序返回
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run_plan_item, plan, repeat(cache)))
+    else:
+        results = [run_plan_item(item, cache) for item in plan]
+
+    failures = 0
+    for item, (output_path, error) in zip(plan, results):
+        if error:
+            failures += 1
+            print(f"❌ 失败: {os.path.basename(item['img1'])} + {os.path.basename(item['img2'])}，错误: {error}")
+        else:
+            print(f"✅ 已保存: {output_path}")
+    print(f"处理完成！成功 {len(plan) - failures}/{len(plan)} 组，解码 {cache.decodes} 张图片，缓存命中 {cache.hits} 次")
+    return failures
+
 def main():
     try:
         # 解析参数
-        direction, number, img1_path, img2_path = parse_args()
+        args = parse_args()
+        if args.plan:
+            jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+            if run_plan(args.plan, jobs, args.cache_mb):
+                sys.exit(1)
+            return
+        direction, number, img1_path, img2_path = args.direction, args.number, args.image1_path, args.image2_path
 
         # 处理图片
         result_image = process_images(direction, number, img1_path, img2_path)
 
-        # 获取输入图片的目录（使用第一张图片的目录）
-        output_dir = os.path.dirname(img1_path)
-        # 如果输入图片没有目录（当前目录），则使用当前工作目录
-        if not output_dir:
-            output_dir = os.getcwd()
-
-        # 生成输出文件名（保留原始图片的扩展名）
-        _, ext = os.path.splitext(img1_path)
-        output_filename = f"result_{direction}_{number}{ext}"
-        # 拼接输出路径（放在输入图片的旁边）
-        output_path = os.path.join(output_dir, output_filename)
+        # 生成输出路径（放在输入图片的旁边，保留原始图片的扩展名）
+        output_path = default_output_path(direction, number, img1_path)
 
         # 保存结果
         result_image.save(output_path)
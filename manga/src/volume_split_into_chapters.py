@@ -1,8 +1,22 @@
 import os
 import shutil
 import argparse
+import errno
 import re
+import ctypes
+import ctypes.util
 import sys
+import zipfile
+from zip_stream import COPY_BUFFER_SIZE, can_copy_raw, copy_member_raw
+
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink', 'move')
+
+# Linux 的 FICLONE ioctl：btrfs / XFS 等文件系统上让两个文件共享数据块
+FICLONE = 0x40049409
+
+# 文件系统或跨设备不支持该操作时的错误码，遇到后按 LINK_FALLBACKS 回退
+LINK_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP,
+                           errno.EINVAL, errno.ENOTTY, errno.EMLINK}
 
 def parse_contents_file(contents_path):
     """
@@ -41,7 +55,138 @@ def extract_number(filename):
     numbers = re.findall(r'\d+', base)
     return int(numbers[-1]) if numbers else 0
 
-def organize_manga(input_dir, dir_page, contents_path):
+# 不支持时改用的方式；reflink 要的是互相独立的副本，不能退回到与源文件共用 inode 的硬链接
+LINK_FALLBACKS = {
+    'reflink': 'copy',
+    'hardlink': 'copy',
+    'symlink': 'copy',
+    'move': 'copy',
+}
+
+_clonefile = None
+
+def load_clonefile():
+    """macOS 的 clonefile(2)，只在第一次使用时通过 ctypes 加载"""
+    global _clonefile
+    if _clonefile is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _clonefile = libc.clonefile
+        _clonefile.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32)
+        _clonefile.restype = ctypes.c_int
+    return _clonefile
+
+def reflink_file(src, dst):
+    """写时复制克隆：只复制元数据，数据块与源文件共享"""
+    if sys.platform == 'darwin':
+        # APFS 的 clonefile 直接在进程内调用，不再为每一页启动一次 cp -c；属性随克隆一起复制
+        if load_clonefile()(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), src)
+        return
+
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+LINK_FUNCTIONS = {
+    'copy': shutil.copy2,
+    'hardlink': os.link,
+    'reflink': reflink_file,
+    'symlink': lambda src, dst: os.symlink(os.path.abspath(src), dst),
+    'move': shutil.move,
+}
+
+class PagePlacer:
+    """按指定方式把页面放进章节文件夹；文件系统不支持时按 LINK_FALLBACKS 回退，之后的页面直接使用回退后的方式"""
+
+    def __init__(self, mode='copy'):
+        self.mode = mode
+
+    def place(self, src, dst):
+        while True:
+            if os.path.lexists(dst):
+                os.remove(dst)
+            try:
+                LINK_FUNCTIONS[self.mode](src, dst)
+                return
+            except OSError as e:
+                fallback = LINK_FALLBACKS.get(self.mode)
+                if fallback is None or e.errno not in LINK_UNSUPPORTED_ERRNOS:
+                    raise
+                print(f"警告: 当前文件系统不支持 {self.mode}（{e.strerror}），改为 {fallback}")
+                self.mode = fallback
+
+def list_volume_pages(input_path, supported_formats):
+    """列出卷中的图片并按数字排序
+
+    文件夹返回 (文件名列表, None)；zip/cbz 返回 (文件名列表, {文件名: ZipInfo})，只读取中央目录，不解压
+    压缩包中的页面按文件名摊平（章节输出和目录页参数都只用文件名），不同目录中有同名页面时直接报错
+    """
+    if os.path.isdir(input_path):
+        return sorted(
+            [f for f in os.listdir(input_path) if f.lower().endswith(supported_formats)],
+            key=extract_number
+        ), None
+
+    # 压缩包中的图片摊平处理，忽略目录结构和 __MACOSX
+    members = {}
+    with zipfile.ZipFile(input_path, 'r') as source:
+        for info in source.infolist():
+            filename = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith('__MACOSX') or not filename.lower().endswith(supported_formats):
+                continue
+            if filename in members:
+                raise ValueError(f"压缩包中有同名页面: {members[filename].filename} 和 {info.filename}")
+            members[filename] = info
+    return sorted(members, key=extract_number), members
+
+def place_chapter_pages(pages, chapter_dir, input_path, members, placer):
+    """把章节页面写入文件夹：源是文件夹时按 link_mode 放置，源是压缩包时逐个解压"""
+    os.makedirs(chapter_dir, exist_ok=True)
+    if members is None:
+        for filename in pages:
+            placer.place(os.path.join(input_path, filename), os.path.join(chapter_dir, filename))
+        return
+
+    with zipfile.ZipFile(input_path, 'r') as source:
+        for filename in pages:
+            with source.open(members[filename]) as src, open(os.path.join(chapter_dir, filename), 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+def write_chapter_archive(pages, archive_path, input_path, members):
+    """把章节页面直接写成压缩包：.cbz 页面放在根目录，.zip 与 zip_all.sh 一样放在同名文件夹中
+
+    源是文件夹时以 ZIP_STORED 写入；源是压缩包时原样复制压缩数据，都不会重新压缩
+    """
+    folder = '' if archive_path.lower().endswith('.cbz') else os.path.splitext(os.path.basename(archive_path))[0] + '/'
+    tmp_path = archive_path + '.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as target:
+        if members is None:
+            for filename in pages:
+                target.write(os.path.join(input_path, filename), folder + filename)
+        else:
+            with zipfile.ZipFile(input_path, 'r') as source, open(input_path, 'rb') as raw_src:
+                for filename in pages:
+                    info = members[filename]
+                    if can_copy_raw(info):
+                        copy_member_raw(raw_src, info, target, folder + filename)
+                    else:
+                        with source.open(info) as src, target.open(zipfile.ZipInfo(folder + filename, info.date_time), 'w') as dst:
+                            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+    os.replace(tmp_path, archive_path)
+
+def organize_manga(input_dir, dir_page, contents_path, link_mode='copy', archive_format=None):
+    """按章节信息拆分一卷漫画
+
+    input_dir 可以是图片文件夹，也可以是 zip/cbz 压缩包（不解压到磁盘）
+    archive_format 为 'cbz' / 'zip' 时每个章节直接写成一个压缩包，否则写成章节文件夹
+    """
     # 解析章节信息
     chapters = parse_contents_file(contents_path)
     if not chapters:
@@ -53,10 +198,7 @@ def organize_manga(input_dir, dir_page, contents_path):
 
     # 获取并排序图片文件（增加对AVIF格式的支持）
     supported_formats = ('.jpg', '.jpeg', '.png', '.avif')
-    all_files = sorted(
-        [f for f in os.listdir(input_dir) if f.lower().endswith(supported_formats)],
-        key=extract_number
-    )
+    all_files, members = list_volume_pages(input_dir, supported_formats)
 
     # 定位目录页
     try:
@@ -72,43 +214,51 @@ def organize_manga(input_dir, dir_page, contents_path):
     chapter_counts.append(len(all_files) - dir_index - sum(chapter_counts))  # 最后一章
 
     # 创建输出目录
-    parent_dir = os.path.dirname(os.path.abspath(input_dir))
-    output_dir = os.path.join(parent_dir, f"{os.path.basename(input_dir)}_split")
+    input_path = os.path.abspath(input_dir)
+    volume_name = os.path.basename(input_path) if members is None else os.path.splitext(os.path.basename(input_path))[0]
+    output_dir = os.path.join(os.path.dirname(input_path), f"{volume_name}_split")
     os.makedirs(output_dir, exist_ok=True)
 
-    # 拆分图片到章节文件夹
-    current_index = dir_index + 1  # 从目录页下一页开始
-    for idx, ((title, _), count) in enumerate(zip(chapters, chapter_counts)):
-        chapter_dir = os.path.join(output_dir, title)
-        os.makedirs(chapter_dir, exist_ok=True)
+    if members is not None and link_mode != 'copy' and not archive_format:
+        print(f"提示: 输入是压缩包，--link-mode {link_mode} 不适用，页面将直接解压到章节文件夹")
 
-        # 复制当前章节的图片
-        for i in range(count):
-            if current_index >= len(all_files):
-                print(f"警告: 章节 {title} 预期 {count} 页，但仅剩 {i} 页可用")
-                break
+    # 拆分图片到章节文件夹或章节压缩包
+    placer = PagePlacer(link_mode)
+    current_index = dir_index + 1  # 从目录页下一页开始
+    for (title, _), count in zip(chapters, chapter_counts):
+        pages = all_files[current_index:current_index + max(count, 0)]
+        if len(pages) < count:
+            print(f"警告: 章节 {title} 预期 {count} 页，但仅剩 {len(pages)} 页可用")
+        current_index += len(pages)
 
-            src = os.path.join(input_dir, all_files[current_index])
-            dst = os.path.join(chapter_dir, all_files[current_index])
-            shutil.copy2(src, dst)
-            current_index += 1
+        if archive_format:
+            write_chapter_archive(pages, os.path.join(output_dir, f"{title}.{archive_format}"), input_path, members)
+        else:
+            # 把当前章节的图片放进章节文件夹（复制 / 硬链接 / 克隆 / 软链接 / 移动）
+            place_chapter_pages(pages, os.path.join(output_dir, title), input_path, members, placer)
 
-        print(f"章节 [{title}] 已保存 {min(count, i+1)} 页")
+        print(f"章节 [{title}] 已保存 {len(pages)} 页")
 
     print(f"\n处理完成! 共拆分 {len(chapters)} 个章节到目录: {output_dir}")
 
 def main():
     parser = argparse.ArgumentParser(description='漫画拆分工具')
-    parser.add_argument('input_dir', help='漫画图片文件夹路径')
+    parser.add_argument('input_dir', help='漫画图片文件夹或 zip/cbz 压缩包路径')
     parser.add_argument('dir_page', help='目录页文件名 (如 "6.jpg")')
     parser.add_argument('contents_file', help='章节信息文件路径')
+    parser.add_argument('--link-mode', choices=LINK_MODES, default='copy',
+                        help='页面放入章节文件夹的方式（默认 copy；hardlink/reflink 只增加元数据，不支持时回退到 copy）')
+    parser.add_argument('--archive', choices=('cbz', 'zip'),
+                        help='每个章节直接写成一个压缩包（不压缩），不再生成章节文件夹')
     args = parser.parse_args()
 
     try:
         organize_manga(
             input_dir=args.input_dir,
             dir_page=args.dir_page,
-            contents_path=args.contents_file
+            contents_path=args.contents_file,
+            link_mode=args.link_mode,
+            archive_format=args.archive
         )
     except Exception as e:
         print(f"错误: {e}")
@@ -0,0 +1,104 @@
+"""
+ZIP 流式处理工具：在压缩包之间原样复制成员的压缩数据，不解压也不重新压缩
+
+原样写入依赖 CPython 3.13 / 3.14 的 zipfile 内部实现（_writecheck、_lock、_writing、start_dir 等），
+写法与 ZipFile.mkdir 相同；其他版本或缺少这些属性时退回到解压后经 ZipFile.open 写入
+tests/test_zip_stream.py 在每个支持的版本上用 testzip() 校验输出
+"""
+import os
+import sys
+import zlib
+import struct
+import zipfile
+
+# 流式复制时的缓冲区大小
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# ZIP 本地文件头
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER_SIZE = 30
+
+# 通用标志位中记录压缩级别的位，原样复制时需要保留
+COMPRESSION_OPTION_BITS = 0x06
+
+# 原样写入时用到的 ZipFile 内部属性，缺少任何一个就退回到公开接口
+RAW_WRITE_ATTRS = ('_writecheck', '_didModify', '_lock', '_writing', '_seekable',
+                   'fp', 'start_dir', 'filelist', 'NameToInfo')
+
+# 按其 zipfile 实现核对过的 CPython 版本，新版本先走公开接口，确认后再加入
+RAW_WRITE_VERSIONS = ((3, 13), (3, 14))
+
+def can_copy_raw(info):
+    """未加密、且是 STORED/DEFLATED 的成员可以直接复制压缩数据"""
+    return not info.flag_bits & 0x01 and info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+def supports_raw_write(zip_file):
+    return (sys.version_info[:2] in RAW_WRITE_VERSIONS
+            and all(hasattr(zip_file, name) for name in RAW_WRITE_ATTRS))
+
+def copy_member_recompressed(src_file, info, dst_zip, zinfo):
+    """退回方案：解压源成员的压缩数据，通过 ZipFile.open 写入（按原压缩方式重新压缩）"""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if info.compress_type == zipfile.ZIP_DEFLATED else None
+    remaining = info.compress_size
+    with dst_zip.open(zinfo, 'w') as dst:
+        while remaining:
+            chunk = src_file.read(min(COPY_BUFFER_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f'压缩数据不完整: {info.filename}')
+            remaining -= len(chunk)
+            dst.write(decompressor.decompress(chunk) if decompressor else chunk)
+        if decompressor:
+            dst.write(decompressor.flush())
+    if zinfo.CRC != info.CRC:
+        raise zipfile.BadZipFile(f'CRC 校验失败: {info.filename}')
+
+def copy_member_raw(src_file, info, dst_zip, arcname):
+    """把源压缩包中成员的压缩数据原样写入目标压缩包，不解压也不重新压缩
+
+    ZipFile 的内部属性不可用时（Python 版本变化）退回到解压后经公开接口写入，结果相同，只是更慢
+    """
+    # 跳过源成员的本地文件头，定位到压缩数据
+    src_file.seek(info.header_offset)
+    header = src_file.read(LOCAL_HEADER_SIZE)
+    if header[:4] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f'本地文件头损坏: {info.filename}')
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    src_file.seek(name_length + extra_length, os.SEEK_CUR)
+
+    # CRC 和大小都沿用源成员，数据不变，所以无需重新计算
+    zinfo = zipfile.ZipInfo(arcname, date_time=info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.flag_bits = info.flag_bits & COMPRESSION_OPTION_BITS
+    zinfo.external_attr = info.external_attr
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+
+    if not supports_raw_write(dst_zip):
+        copy_member_recompressed(src_file, info, dst_zip, zinfo)
+        return
+
+    # zipfile 没有提供写入原始压缩数据的接口，这里按 ZipFile.mkdir 的方式在锁内维护写入状态
+    if not dst_zip.fp:
+        raise ValueError('目标压缩包已关闭')
+    if dst_zip._writing:
+        raise ValueError('目标压缩包还有未关闭的写入句柄')
+    with dst_zip._lock:
+        if dst_zip._seekable:
+            dst_zip.fp.seek(dst_zip.start_dir)
+        zinfo.header_offset = dst_zip.fp.tell()
+        dst_zip._writecheck(zinfo)
+        dst_zip._didModify = True
+        dst_zip.fp.write(zinfo.FileHeader())
+
+        remaining = info.compress_size
+        while remaining:
+            chunk = src_file.read(min(COPY_BUFFER_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f'压缩数据不完整: {info.filename}')
+            dst_zip.fp.write(chunk)
+            remaining -= len(chunk)
+
+        dst_zip.start_dir = dst_zip.fp.tell()
+        dst_zip.filelist.append(zinfo)
+        dst_zip.NameToInfo[zinfo.filename] = zinfo